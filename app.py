@@ -1,17 +1,19 @@
 import os
+import gzip
 import logging
-import uuid
-import tempfile
-from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify
+from datetime import datetime, timedelta
+from flask import Flask, Response, render_template, request, redirect, url_for, flash, session, jsonify
 from werkzeug.utils import secure_filename
-import time
 
-# Import document processing modules
-from text_extractor import extract_text_from_document
-from document_analyzer import analyze_document
-from forgery_detector import detect_forgery
-from scam_detector import detect_scams
-from models import db, Report
+from models import db, Report, AnalysisJob, Alert, upgrade_schema
+from jobs import job_queue, get_cached_report
+from batch import BatchError, read_batch_uploads, analyze_batch
+from pipeline import run_analysis, NoTextExtractedError, AnalysisDeadlineExceeded
+from result_cache import result_cache
+from report_cache import report_cache, get_report_data, cache_report
+from ocr_cache import ocr_cache
+from document import Document
+from metrics import registry
 
 # Set up logging
 logging.basicConfig(level=logging.DEBUG)
@@ -21,23 +23,78 @@ logger = logging.getLogger(__name__)
 app = Flask(__name__)
 app.secret_key = os.environ.get("SESSION_SECRET", "default_dev_key")
 app.config['MAX_CONTENT_LENGTH'] = 10 * 1024 * 1024  # 10MB max file size
-app.config['UPLOAD_FOLDER'] = tempfile.mkdtemp()  # Use temporary directory for uploads
+app.config['BATCH_MAX_CONTENT_LENGTH'] = int(os.environ.get('BATCH_MAX_CONTENT_LENGTH', 200 * 1024 * 1024))
 app.config['ALLOWED_EXTENSIONS'] = {'pdf', 'docx', 'jpg', 'jpeg', 'png'}
+app.config['API_GZIP_MIN_SIZE'] = int(os.environ.get('API_GZIP_MIN_SIZE', 1024))  # Smaller API responses are sent uncompressed
 
 # Database configuration
 app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 db.init_app(app)
 
-# Create database tables if they don't exist
+# Background worker pool for document analysis. ANALYSIS_WORKERS is per web worker
+# process: each gunicorn worker starts its own pool, so a server runs up to
+# (web workers x ANALYSIS_WORKERS) analyses at once. The pool lives in memory, so jobs
+# left queued or running by a restart are marked failed after JOB_STALE_AFTER seconds
+app.config['ANALYSIS_WORKERS'] = int(os.environ.get('ANALYSIS_WORKERS', os.cpu_count() or 2))
+job_queue.init_app(app)
+
+# Queue depth and cache effectiveness, read when /metrics is scraped
+registry.gauge('legaldoc_jobs_queued', 'Analysis jobs waiting for a worker', lambda: job_queue.depth()[0])
+registry.gauge('legaldoc_jobs_running', 'Analysis jobs currently being processed', lambda: job_queue.depth()[1])
+registry.gauge('legaldoc_result_cache_entries', 'Documents in the result cache', lambda: result_cache.stats()['entries'])
+registry.gauge('legaldoc_result_cache_hits_total', 'Result cache hits', lambda: result_cache.stats()['hits'], 'counter')
+registry.gauge('legaldoc_result_cache_misses_total', 'Result cache misses', lambda: result_cache.stats()['misses'], 'counter')
+registry.gauge('legaldoc_result_cache_evictions_total', 'Result cache evictions', lambda: result_cache.stats()['evictions'], 'counter')
+registry.gauge('legaldoc_result_cache_hit_ratio', 'Fraction of result cache lookups that hit', lambda: result_cache.stats()['hit_rate'])
+registry.gauge('legaldoc_report_cache_entries', 'Rendered reports in the report cache', lambda: report_cache.stats()['entries'])
+registry.gauge('legaldoc_report_cache_hits_total', 'Report cache hits', lambda: report_cache.stats()['hits'], 'counter')
+registry.gauge('legaldoc_report_cache_misses_total', 'Report cache misses', lambda: report_cache.stats()['misses'], 'counter')
+registry.gauge('legaldoc_report_cache_hit_ratio', 'Fraction of report cache lookups that hit', lambda: report_cache.stats()['hit_rate'])
+registry.gauge('legaldoc_ocr_cache_entries', 'Page images in the OCR cache', lambda: ocr_cache.stats()['entries'])
+registry.gauge('legaldoc_ocr_cache_bytes', 'Size of the text held in the OCR cache', lambda: ocr_cache.stats()['bytes'])
+registry.gauge('legaldoc_ocr_cache_hits_total', 'OCR cache hits', lambda: ocr_cache.stats()['hits'], 'counter')
+registry.gauge('legaldoc_ocr_cache_misses_total', 'OCR cache misses', lambda: ocr_cache.stats()['misses'], 'counter')
+registry.gauge('legaldoc_ocr_cache_evictions_total', 'OCR cache evictions', lambda: ocr_cache.stats()['evictions'], 'counter')
+
+# Create database tables if they don't exist, and add newer columns to old ones
 with app.app_context():
     db.create_all()
+    upgrade_schema()
+    job_queue.fail_stale_jobs()
 
 def allowed_file(filename):
     """Check if the file extension is allowed"""
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
 
+def wants_json():
+    """Check if the client prefers a JSON response over HTML"""
+    best = request.accept_mimetypes.best_match(['application/json', 'text/html'])
+    return best == 'application/json' and \
+           request.accept_mimetypes[best] > request.accept_mimetypes['text/html']
+
+def is_api_request():
+    """Check if the request targets the JSON API"""
+    return request.path.startswith('/api/')
+
+@app.after_request
+def compress_api_response(response):
+    """Gzip JSON API responses for clients that accept it"""
+    if not is_api_request() or response.mimetype != 'application/json' or response.direct_passthrough:
+        return response
+    if 'Content-Encoding' in response.headers or request.accept_encodings['gzip'] <= 0:
+        return response
+    
+    data = response.get_data()
+    if len(data) < app.config['API_GZIP_MIN_SIZE']:
+        return response
+    
+    response.set_data(gzip.compress(data, compresslevel=6))
+    response.headers['Content-Encoding'] = 'gzip'
+    response.vary.add('Accept-Encoding')
+    return response
+
 @app.route('/')
 def index():
     """Render main page"""
@@ -59,108 +116,198 @@ def upload_file():
         flash('File type not allowed. Please upload PDF, DOCX, JPG, JPEG, or PNG.', 'danger')
         return redirect(request.url)
     
-    # Generate unique filename to avoid collisions
-    filename = secure_filename(file.filename)
-    unique_filename = f"{str(uuid.uuid4())}_{filename}"
-    filepath = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
-    
     try:
-        file.save(filepath)
-        logger.info(f"File saved to {filepath}")
-        
-        # Process the document
-        start_time = time.time()
-        
-        # Extract text from the document
-        logger.info("Extracting text...")
-        document_text = extract_text_from_document(filepath)
-        
-        if not document_text or document_text.strip() == "":
-            flash("Could not extract text from document. Please check the file and try again.", "danger")
-            return redirect(url_for('index'))
-        
-        # Analyze the document text
-        logger.info("Analyzing document...")
-        analysis_results = analyze_document(document_text, filepath)
-        
-        # Detect forgery
-        logger.info("Checking for forgery...")
-        forgery_results = detect_forgery(document_text, filepath)
-        
-        # Detect scams
-        logger.info("Checking for scams...")
-        scam_results = detect_scams(document_text)
-        
-        # Calculate overall risk score based on forgery and scam results
-        risk_scores = {
-            "forgery_risk": forgery_results['risk_score'],
-            "scam_risk": scam_results['risk_score'],
-        }
-        
-        combined_risk_score = max(risk_scores.values())
-        risk_level = "Low" if combined_risk_score < 0.4 else "Medium" if combined_risk_score < 0.7 else "High"
-        
-        # Store results in session for display
-        report_data = {
-            "filename": filename,
-            "summary": analysis_results['summary'],
-            "key_terms": analysis_results['key_terms'],
-            "forgery_alerts": forgery_results['alerts'],
-            "scam_alerts": scam_results['alerts'],
-            "risk_scores": risk_scores,
-            "risk_level": risk_level,
-            "processing_time": f"{time.time() - start_time:.2f}"
-        }
+        # Keep the upload in memory; it only touches disk if poppler needs a path
+        document = Document.from_upload(file, secure_filename(file.filename))
+        logger.info(f"Received {document.filename} ({len(document)} bytes)")
         
-        # Save report to database
-        try:
-            new_report = Report.from_dict(report_data)
-            db.session.add(new_report)
+        # Queue the document for analysis by the worker pool
+        job_id = job_queue.submit(document)
+    except Exception as e:
+        logger.error(f"Error queueing document: {str(e)}", exc_info=True)
+        flash(f"Error processing document: {str(e)}", "danger")
+        return redirect(url_for('index'))
+    
+    if wants_json():
+        return jsonify({
+            "job_id": job_id,
+            "status": "queued",
+            "status_url": url_for('job_status', job_id=job_id)
+        }), 202
+    
+    return redirect(url_for('job_status', job_id=job_id))
+
+@app.route('/api/analyze', methods=['POST'])
+def api_analyze():
+    """Analyze one document in the request and return its report as JSON"""
+    file = request.files.get('document')
+    if file is None or file.filename == '':
+        return jsonify({"error": "No file provided"}), 400
+    
+    if not allowed_file(file.filename):
+        return jsonify({"error": "File type not allowed. Please upload PDF, DOCX, JPG, JPEG, or PNG."}), 400
+    
+    document = Document.from_upload(file, secure_filename(file.filename))
+    
+    try:
+        # Repeat uploads of the same bytes are answered from the result cache
+        report_obj = get_cached_report(document.digest)
+        if report_obj is None:
+            report_obj = Report.from_dict(run_analysis(document))
+            db.session.add(report_obj)
             db.session.commit()
-            logger.info(f"Report saved to database with ID: {new_report.id}")
-            
-            # Store report ID in session
-            session['report_id'] = new_report.id
-        except Exception as e:
-            logger.error(f"Error saving report to database: {str(e)}", exc_info=True)
-            flash("Report generated but couldn't be saved to database.", "warning")
-        
-        session['report_data'] = report_data
-        
-        logger.info("Document analysis complete")
-        return redirect(url_for('report'))
+            result_cache.put(document.digest, report_obj.id)
+            logger.info(f"Report saved to database with ID: {report_obj.id}")
+            report_data = cache_report(report_obj)
+        else:
+            report_data = get_report_data(report_obj.id)
         
+        return jsonify(report_data)
+    except NoTextExtractedError as e:
+        return jsonify({"error": str(e)}), 422
+    except AnalysisDeadlineExceeded as e:
+        logger.warning(f"Analysis of {document.filename} timed out: {str(e)}")
+        return jsonify({"error": str(e)}), 504
     except Exception as e:
+        db.session.rollback()
         logger.error(f"Error processing document: {str(e)}", exc_info=True)
-        flash(f"Error processing document: {str(e)}", "danger")
-        return redirect(url_for('index'))
+        return jsonify({"error": f"Error processing document: {str(e)}"}), 500
     finally:
-        # Clean up uploaded file
-        try:
-            if os.path.exists(filepath):
-                os.remove(filepath)
-        except Exception as e:
-            logger.error(f"Error cleaning up file: {str(e)}")
+        document.close()
+
+@app.route('/api/batch', methods=['POST'])
+def batch_analyze():
+    """Analyze many documents (or zip archives of documents) in one request"""
+    # Batches may be much larger than single uploads
+    request.max_content_length = app.config['BATCH_MAX_CONTENT_LENGTH']
+    
+    files = request.files.getlist('documents') + request.files.getlist('document')
+    if not files:
+        return jsonify({"error": "No files provided"}), 400
+    
+    documents = []
+    try:
+        documents = read_batch_uploads(files, allowed_file)
+        if not documents:
+            return jsonify({"error": "No supported documents found. Please upload PDF, DOCX, JPG, JPEG, or PNG files."}), 400
+        
+        results = analyze_batch(documents)
+    except BatchError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error processing batch: {str(e)}", exc_info=True)
+        return jsonify({"error": f"Error processing batch: {str(e)}"}), 500
+    finally:
+        for document in documents:
+            document.close()
+    
+    return jsonify({
+        "count": len(results),
+        "failed": sum(1 for result in results if result["status"] == "failed"),
+        "documents": results
+    })
+
+def parse_time_window():
+    """Read the since/until (ISO 8601) or days query arguments, defaulting to the last 7 days"""
+    until = datetime.fromisoformat(request.args['until']) if request.args.get('until') else datetime.utcnow()
+    if request.args.get('since'):
+        since = datetime.fromisoformat(request.args['since'])
+    else:
+        since = until - timedelta(days=request.args.get('days', 7, type=int))
+    return since, until
+
+def alert_filters():
+    """Optional alert filters shared by the alert endpoints"""
+    return {
+        'source': request.args.get('source'),
+        'alert_type': request.args.get('type'),
+        'risk_level': request.args.get('risk_level')
+    }
+
+@app.route('/api/alerts')
+def api_alerts():
+    """List stored alerts (with their report) matching type, risk level and time filters"""
+    try:
+        since, until = parse_time_window()
+    except ValueError:
+        return jsonify({"error": "Invalid since/until, expected ISO 8601 timestamps"}), 400
+    limit = min(max(request.args.get('limit', 100, type=int), 1), 1000)
+    
+    rows = Alert.search(since, until, limit=limit, **alert_filters())
+    return jsonify({
+        "since": since.isoformat(),
+        "until": until.isoformat(),
+        "alerts": [dict(alert.to_dict(), filename=filename) for alert, filename in rows]
+    })
+
+@app.route('/api/alerts/summary')
+def api_alert_summary():
+    """Count alerts and affected reports by source, type and risk level over a time window"""
+    try:
+        since, until = parse_time_window()
+    except ValueError:
+        return jsonify({"error": "Invalid since/until, expected ISO 8601 timestamps"}), 400
+    
+    return jsonify({
+        "since": since.isoformat(),
+        "until": until.isoformat(),
+        "counts": Alert.counts(since, until, **alert_filters())
+    })
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    """Report the status of a queued analysis job"""
+    job = db.session.get(AnalysisJob, job_id)
+    if job:
+        job_queue.fail_if_stale(job)
+    
+    if wants_json():
+        if not job:
+            return jsonify({"error": "Job not found"}), 404
+        job_data = job.to_dict()
+        if job.report_id:
+            job_data['report_url'] = url_for('report', report_id=job.report_id)
+        elif job.status == 'finished':
+            job_data['error'] = "The report for this analysis was deleted."
+        return jsonify(job_data)
+    
+    if not job:
+        flash("Analysis job not found.", "warning")
+        return redirect(url_for('index'))
+    
+    if job.status == 'finished' and job.report_id:
+        session['report_id'] = job.report_id
+        return redirect(url_for('report', report_id=job.report_id))
+    
+    if job.status == 'finished':
+        # Deleting the report cleared the job's report_id
+        flash("The report for this analysis was deleted.", "warning")
+        return redirect(url_for('index'))
+    
+    if job.status == 'failed':
+        flash(f"Error processing document: {job.error}", "danger")
+        return redirect(url_for('index'))
+    
+    return render_template('job.html', job=job)
 
 @app.route('/report')
 @app.route('/report/<int:report_id>')
 def report(report_id=None):
     """Display the document analysis report"""
-    # If a specific report ID is provided, retrieve it
+    # If a specific report ID is provided, retrieve it (from the report cache when possible)
     if report_id:
         try:
-            report_obj = Report.query.get(report_id)
-            if not report_obj:
+            report_data = get_report_data(report_id)
+            if not report_data:
                 flash("Report not found.", "warning")
                 return redirect(url_for('index'))
-            report_data = report_obj.to_dict()
         except Exception as e:
             logger.error(f"Error retrieving report {report_id}: {str(e)}", exc_info=True)
             flash("Error retrieving report from database.", "danger")
             return redirect(url_for('index'))
-    # Otherwise use the report from session (newly generated)
-    elif 'report_data' in session:
-        report_data = session['report_data']
+    # Otherwise show the most recent report from this session
+    elif 'report_id' in session:
+        return redirect(url_for('report', report_id=session['report_id']))
     else:
         flash("No report data available. Please upload a document first.", "warning")
         return redirect(url_for('index'))
@@ -170,16 +317,39 @@ def report(report_id=None):
 @app.errorhandler(413)
 def too_large(e):
     """Handle file size exceeded error"""
+    if is_api_request():
+        return jsonify({"error": "Request too large."}), 413
     flash("File too large. Maximum file size is 10MB.", "danger")
     return redirect(url_for('index'))
 
+def format_history_cursor(cursor):
+    """Encode a (created_at, id) history key for use in a URL"""
+    if cursor is None:
+        return None
+    created_at, report_id = cursor
+    return f"{created_at.isoformat()}_{report_id}"
+
+def parse_history_cursor(value):
+    """Decode a history cursor from a URL, ignoring malformed values"""
+    if not value:
+        return None
+    try:
+        created_at, report_id = value.rsplit('_', 1)
+        return datetime.fromisoformat(created_at), int(report_id)
+    except ValueError:
+        logger.warning(f"Ignoring invalid history cursor: {value}")
+        return None
+
 @app.route('/history')
 def history():
     """Display history of document analyses"""
     try:
-        # Retrieve the most recent 20 reports
-        reports = Report.query.order_by(Report.created_at.desc()).limit(20).all()
-        return render_template('history.html', reports=reports)
+        before = parse_history_cursor(request.args.get('before'))
+        per_page = min(max(request.args.get('per_page', 20, type=int), 1), 100)
+        
+        reports, next_cursor = Report.history_page(before, per_page)
+        return render_template('history.html', reports=reports, per_page=per_page,
+                               next_cursor=format_history_cursor(next_cursor), is_first_page=before is None)
     except Exception as e:
         logger.error(f"Error retrieving report history: {str(e)}", exc_info=True)
         flash("Error retrieving report history from database.", "danger")
@@ -193,6 +363,8 @@ def delete_report(report_id):
         if report:
             db.session.delete(report)
             db.session.commit()
+            result_cache.invalidate_report(report_id)
+            report_cache.invalidate(report_id)
             flash("Report deleted successfully.", "success")
         else:
             flash("Report not found.", "warning")
@@ -202,6 +374,11 @@ def delete_report(report_id):
     
     return redirect(url_for('history'))
 
+@app.route('/metrics')
+def metrics():
+    """Expose pipeline metrics in the Prometheus text format"""
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
 @app.errorhandler(404)
 def page_not_found(e):
     """Handle 404 error"""
@@ -0,0 +1,167 @@
+import os
+import logging
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from werkzeug.utils import secure_filename
+
+from models import db, Report
+from pipeline import run_analysis, analyze_texts
+from result_cache import result_cache
+from document import Document
+from report_cache import cache_report
+from deadline import BATCH_DEADLINE, check_deadline
+
+logger = logging.getLogger(__name__)
+
+# Limits for a single batch request
+BATCH_WORKERS = int(os.environ.get('BATCH_WORKERS', os.cpu_count() or 2))
+BATCH_MAX_DOCUMENTS = int(os.environ.get('BATCH_MAX_DOCUMENTS', 200))
+BATCH_MAX_ARCHIVE_SIZE = int(os.environ.get('BATCH_MAX_ARCHIVE_SIZE', 200 * 1024 * 1024))
+# New reports are text-analyzed together and committed this many at a time as
+# documents finish, so a batch cut short keeps the work already done
+BATCH_COMMIT_SIZE = int(os.environ.get('BATCH_COMMIT_SIZE', 8))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+class BatchError(ValueError):
+    """Raised when a batch request cannot be accepted as a whole"""
+    pass
+
+def _get_executor():
+    """Shared worker pool for batch requests, started on first use"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=BATCH_WORKERS, thread_name_prefix='batch')
+            logger.info(f"Started batch analysis pool with {BATCH_WORKERS} workers")
+    return _executor
+
+def _extract_archive(archive_file, allowed_file):
+    """Read the supported documents in a zip archive into memory"""
+    documents = []
+    with zipfile.ZipFile(archive_file) as archive:
+        members = [info for info in archive.infolist()
+                   if not info.is_dir() and allowed_file(os.path.basename(info.filename))]
+        if sum(info.file_size for info in members) > BATCH_MAX_ARCHIVE_SIZE:
+            raise BatchError("Archive is too large to extract.")
+
+        for info in members:
+            filename = secure_filename(os.path.basename(info.filename))
+            if filename:
+                documents.append(Document(archive.read(info), filename))
+    return documents
+
+def read_batch_uploads(files, allowed_file):
+    """
+    Read uploaded files (and the contents of any zip archives among them) into
+    memory and return the Documents to analyze
+    """
+    documents = []
+    for file in files:
+        filename = secure_filename(file.filename or '')
+        if not filename:
+            continue
+
+        if filename.lower().endswith('.zip'):
+            try:
+                documents.extend(_extract_archive(file.stream, allowed_file))
+            except zipfile.BadZipFile:
+                raise BatchError(f"{filename} is not a valid zip archive.")
+        elif allowed_file(filename):
+            documents.append(Document.from_upload(file, filename))
+        else:
+            logger.warning(f"Skipping unsupported file in batch: {filename}")
+
+        if len(documents) > BATCH_MAX_DOCUMENTS:
+            raise BatchError(f"A batch may contain at most {BATCH_MAX_DOCUMENTS} documents.")
+
+    return documents
+
+def _analyze(document, deadline):
+    """Analyze one document in the worker pool, returning (cached report id, report_data)"""
+    cached_report_id = result_cache.get(document.digest)
+    if cached_report_id is not None:
+        return cached_report_id, None
+    check_deadline(deadline, "Batch time ran out before this document was analyzed; submit it again")
+    # The text analysis runs for a chunk of documents at once, in _store_reports
+    return None, run_analysis(document, deadline, analyze_text=False)
+
+def _store_reports(new_reports):
+    """
+    Analyze the text of a chunk of finished documents in one batch, then commit
+    their reports and remember them in the result cache; returns the number stored
+    """
+    if not new_reports:
+        return 0
+    try:
+        analyze_texts([report_data for _, report_data, _ in new_reports])
+    except Exception as e:
+        logger.error(f"Error analyzing the text of {len(new_reports)} batch documents: {str(e)}", exc_info=True)
+        for _, _, result in new_reports:
+            result["status"] = "failed"
+            result["error"] = str(e)
+        return 0
+
+    reports = []
+    for digest, report_data, result in new_reports:
+        result["report"] = Report.from_dict(report_data)
+        reports.append((digest, result["report"]))
+    db.session.add_all([report for _, report in reports])
+    db.session.commit()
+    for digest, report in reports:
+        result_cache.put(digest, report.id)
+    return len(reports)
+
+def analyze_batch(documents):
+    """
+    Analyze many in-memory Documents in parallel, committing new reports in chunks as they finish
+
+    Analysis stops BATCH_DEADLINE seconds after the batch starts. Returns one
+    result dict per document, in the order given, with the report (as
+    Report.to_dict) or the error that stopped its analysis.
+    """
+    deadline = time.monotonic() + BATCH_DEADLINE
+    executor = _get_executor()
+    futures = {executor.submit(_analyze, document, deadline): index for index, document in enumerate(documents)}
+
+    results = [None] * len(documents)
+    new_reports = []  # (digest, report_data, result) not stored yet
+    stored = 0
+    for future in as_completed(futures):
+        document = documents[futures[future]]
+        result = {"filename": document.filename}
+        try:
+            cached_report_id, report_data = future.result()
+            report = None
+            if cached_report_id is not None:
+                report = db.session.get(Report, cached_report_id)
+                if report is None:
+                    # The cached report was deleted, so analyze the document again
+                    result_cache.discard(document.digest)
+                    report_data = run_analysis(document, deadline, analyze_text=False)
+            if report is None:
+                new_reports.append((document.digest, report_data, result))
+            else:
+                result["report"] = report
+            result["status"] = "finished"
+        except Exception as e:
+            logger.error(f"Error processing batch document {document.filename}: {str(e)}", exc_info=True)
+            result["status"] = "failed"
+            result["error"] = str(e)
+        results[futures[future]] = result
+
+        if len(new_reports) >= BATCH_COMMIT_SIZE:
+            stored += _store_reports(new_reports)
+            new_reports = []
+
+    stored += _store_reports(new_reports)
+    logger.info(f"Batch of {len(documents)} documents finished, {stored} new reports saved")
+
+    for result in results:
+        if "report" in result:
+            result["report"] = cache_report(result["report"])
+    return results
@@ -0,0 +1,329 @@
+"""
+Benchmark the analysis pipeline on a reproducible synthetic corpus
+
+Builds text PDFs, scanned-image PDFs, DOCX files and PNG/JPEG scans of several
+sizes (with planted scam clauses and signature-like strokes), runs every stage
+on each document and reports throughput and p50/p95 latency per stage.
+
+    python benchmark.py --repeat 5 --output benchmark_results.json
+    python benchmark.py --compare benchmark_results.json
+
+Stages that need tools missing on this machine (tesseract, poppler) are
+recorded as errors rather than aborting the run.
+"""
+import os
+import io
+import sys
+import json
+import time
+import random
+import logging
+import platform
+import argparse
+import subprocess
+from collections import defaultdict
+
+import cv2
+import docx
+from PIL import Image, ImageDraw, ImageFont
+
+from document import Document
+from page_images import PageImageProvider
+from text_extractor import extract_text_from_document
+from document_analyzer import analyze_document, preload_nlp
+from forgery_detector import (detect_font_inconsistencies, check_signature_irregularities,
+                              detect_image_manipulation, error_level_analysis,
+                              check_metadata_inconsistencies, detect_forgery, load_image)
+from copy_move_detector import find_copy_move_regions
+from scam_detector import detect_scams
+from ocr_cache import ocr_cache
+
+logger = logging.getLogger(__name__)
+
+DOCUMENT_KINDS = ['text_pdf', 'scanned_pdf', 'docx', 'png', 'jpeg']
+
+# Page counts for each size class; image scans are always a single page
+SIZE_CLASSES = {'small': 1, 'medium': 5, 'large': 20}
+
+# Page geometry for rendered scans (US Letter at 100 DPI keeps the corpus small)
+PAGE_SIZE = (850, 1100)
+LINE_HEIGHT = 18
+LINES_PER_PAGE = 48
+
+BOILERPLATE = [
+    "This Agreement is entered into by and between {a} and {b} on {date}.",
+    "The parties agree to the terms and conditions set out in this contract.",
+    "Payment of ${amount} shall be made within 30 days of the invoice date.",
+    "Either party may terminate this Agreement with sixty days written notice.",
+    "This Agreement shall be governed by the laws of the State of {state}.",
+    "Confidentiality obligations apply to all proprietary information exchanged.",
+    "Neither party shall be liable for delays caused by force majeure events.",
+    "Any amendment to this Agreement must be made in writing and signed by both parties.",
+    "The Service Provider warrants that all services will be performed diligently.",
+    "Notices shall be delivered to the addresses listed on the signature page.",
+]
+
+SCAM_CLAUSES = [
+    "The Company may terminate this agreement at any time without notice.",
+    "Additional fees may apply at the sole discretion of the Company.",
+    "The Client waives all claims against the Company and its affiliates.",
+    "You must sign immediately as this is a limited-time offer.",
+    "A processing fee of $499 is due by wire transfer before any funds are released.",
+    "Payment must be made in bitcoin or gift cards to the account provided.",
+    "Disputes shall be resolved exclusively by binding arbitration.",
+    "The individual signing shall be personally liable for all obligations.",
+]
+
+PARTIES = ["Acme Corporation", "Globex LLC", "Initech Inc", "John Smith", "Jane Doe", "Stark Industries"]
+STATES = ["Delaware", "New York", "California", "Texas"]
+
+def generate_lines(rng, line_count, scam_rate=0.08):
+    """Deterministic contract-like lines with scam clauses planted at scam_rate"""
+    lines = []
+    for _ in range(line_count):
+        if rng.random() < scam_rate:
+            lines.append(rng.choice(SCAM_CLAUSES))
+        else:
+            lines.append(rng.choice(BOILERPLATE).format(
+                a=rng.choice(PARTIES), b=rng.choice(PARTIES), state=rng.choice(STATES),
+                amount=f"{rng.randint(1, 500) * 100:,}",
+                date=f"{rng.choice(['January', 'March', 'June', 'October'])} {rng.randint(1, 28)}, {rng.randint(2015, 2025)}"
+            ))
+    return lines
+
+def _pdf_escape(text):
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+def write_text_pdf(path, pages):
+    """Write a minimal PDF with one Helvetica text stream per page"""
+    objects = [None, None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_ids = []
+    for lines in pages:
+        content = ["BT /F1 11 Tf 14 TL 72 740 Td"]
+        content.extend(f"({_pdf_escape(line)}) '" for line in lines)
+        content.append("ET")
+        stream = "\n".join(content).encode('latin-1')
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents %d 0 R "
+                       b"/Resources << /Font << /F1 3 0 R >> >> >>" % len(objects))
+        page_ids.append(len(objects))
+    objects[0] = b"<< /Type /Catalog /Pages 2 0 R >>"
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        b" ".join(b"%d 0 R" % page_id for page_id in page_ids), len(page_ids))
+    objects.append(b"<< /Producer (legaldoc benchmark) /CreationDate (D:20200101000000) /ModDate (D:20200102000000) >>")
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+    xref_offset = out.tell()
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    for offset in offsets:
+        out.write(b"%010d 00000 n \n" % offset)
+    out.write(b"trailer\n<< /Size %d /Root 1 0 R /Info %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (
+        len(objects) + 1, len(objects), xref_offset))
+    with open(path, 'wb') as f:
+        f.write(out.getvalue())
+
+def draw_signature(draw, rng, box):
+    """Draw a handwriting-like stroke inside box = (x0, y0, x1, y1)"""
+    x0, y0, x1, y1 = box
+    points = []
+    for step in range(40):
+        x = x0 + (x1 - x0) * step / 39
+        y = (y0 + y1) / 2 + rng.uniform(-1, 1) * (y1 - y0) / 2
+        points.append((x, y))
+    draw.line(points, fill=0, width=3)
+
+def render_scan(rng, lines, with_signatures=True):
+    """Render lines of text onto a grayscale page image, like a scanned page"""
+    image = Image.new('L', PAGE_SIZE, 255)
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.load_default()
+    y = 60
+    for line in lines:
+        draw.text((60, y), line, fill=0, font=font)
+        y += LINE_HEIGHT
+    if with_signatures:
+        for index in range(rng.randint(1, 3)):
+            left = 80 + index * 250
+            draw_signature(draw, rng, (left, PAGE_SIZE[1] - 140, left + 200, PAGE_SIZE[1] - 70))
+    return image
+
+def build_corpus(corpus_dir, seed=1234, kinds=DOCUMENT_KINDS, sizes=SIZE_CLASSES):
+    """Generate the benchmark corpus (skipping files that already exist) and return its manifest"""
+    os.makedirs(corpus_dir, exist_ok=True)
+    manifest = []
+    for kind in kinds:
+        for size, page_count in sizes.items():
+            if kind in ('png', 'jpeg') and page_count > 1:
+                continue
+            rng = random.Random(f"{seed}:{kind}:{size}")
+            pages = [generate_lines(rng, LINES_PER_PAGE) for _ in range(page_count)]
+            extension = {'text_pdf': 'pdf', 'scanned_pdf': 'pdf', 'docx': 'docx', 'png': 'png', 'jpeg': 'jpg'}[kind]
+            path = os.path.join(corpus_dir, f"{kind}_{size}.{extension}")
+            manifest.append({'kind': kind, 'size': size, 'pages': page_count, 'path': path})
+            if os.path.exists(path):
+                continue
+
+            if kind == 'text_pdf':
+                write_text_pdf(path, pages)
+            elif kind == 'scanned_pdf':
+                images = [render_scan(rng, lines).convert('RGB') for lines in pages]
+                images[0].save(path, 'PDF', resolution=100, save_all=True, append_images=images[1:])
+            elif kind == 'docx':
+                document = docx.Document()
+                for lines in pages:
+                    for line in lines:
+                        document.add_paragraph(line)
+                document.save(path)
+            else:
+                image = render_scan(rng, pages[0])
+                image.save(path, 'PNG' if kind == 'png' else 'JPEG', quality=90)
+    return manifest
+
+def first_page_image(document):
+    """Decoded first page (PDF) or image for the image forensics stages"""
+    if document.extension == '.pdf':
+        with PageImageProvider(document) as page_images:
+            return load_image(page_images.get_page(1))
+    return load_image(document)
+
+def benchmark_document(entry, samples, errors):
+    """Run every stage once on a document, appending durations per (stage, kind)"""
+    def timed(stage, function, *args):
+        start = time.perf_counter()
+        try:
+            result = function(*args)
+        except Exception as e:
+            errors[stage].add(f"{type(e).__name__}: {e}")
+            return None
+        samples[(stage, entry['kind'])].append(time.perf_counter() - start)
+        return result
+
+    # Measure cold OCR on every pass rather than cache hits
+    ocr_cache.clear()
+
+    with Document.from_path(entry['path']) as document:
+        # Later stages still run (on empty text) when extraction fails
+        text = timed('extract_text_from_document', extract_text_from_document, document) or ""
+        if text.strip():
+            timed('analyze_document', analyze_document, text)
+        timed('detect_font_inconsistencies', detect_font_inconsistencies, text)
+
+        image = None
+        if document.extension != '.docx':
+            image = timed('render_first_page', first_page_image, document)
+        if image is not None:
+            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+            timed('check_signature_irregularities', check_signature_irregularities, image)
+            timed('detect_image_manipulation', detect_image_manipulation, image)
+            timed('error_level_analysis', error_level_analysis, image)
+            timed('find_copy_move_regions', find_copy_move_regions, gray)
+        if document.extension == '.pdf':
+            timed('check_metadata_inconsistencies', check_metadata_inconsistencies, document)
+        timed('detect_forgery', detect_forgery, text, document)
+        timed('detect_scams', detect_scams, text)
+
+def percentile(values, fraction):
+    """Linearly interpolated percentile of a non-empty list"""
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+def summarize(values):
+    total = sum(values)
+    return {
+        'count': len(values),
+        'p50_ms': round(percentile(values, 0.5) * 1000, 3),
+        'p95_ms': round(percentile(values, 0.95) * 1000, 3),
+        'mean_ms': round(total / len(values) * 1000, 3),
+        'throughput_per_s': round(len(values) / total, 3) if total else None
+    }
+
+def run_benchmark(manifest, repeat):
+    samples = defaultdict(list)
+    errors = defaultdict(set)
+
+    # Warm up lazy state (spaCy model, rule tables) outside the measurements
+    preload_nlp()
+    analyze_document("Warm-up agreement between Acme Corporation and Jane Doe.")
+
+    for _ in range(repeat):
+        for entry in manifest:
+            benchmark_document(entry, samples, errors)
+
+    stages = defaultdict(list)
+    by_kind = defaultdict(dict)
+    for (stage, kind), values in samples.items():
+        stages[stage].extend(values)
+        by_kind[stage][kind] = summarize(values)
+
+    return {
+        'stages': {stage: dict(summarize(values), by_kind=by_kind[stage]) for stage, values in sorted(stages.items())},
+        'errors': {stage: sorted(messages) for stage, messages in sorted(errors.items())}
+    }
+
+def environment_info():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'commit': commit,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S')
+    }
+
+def print_report(results, baseline=None):
+    print(f"{'stage':34} {'count':>6} {'p50 ms':>10} {'p95 ms':>10} {'docs/s':>9}" + ("  p50 vs base" if baseline else ""))
+    for stage, stats in results['stages'].items():
+        line = f"{stage:34} {stats['count']:>6} {stats['p50_ms']:>10.2f} {stats['p95_ms']:>10.2f} {stats['throughput_per_s'] or 0:>9.2f}"
+        base = baseline.get('stages', {}).get(stage) if baseline else None
+        if base and base['p50_ms']:
+            line += f"  {(stats['p50_ms'] - base['p50_ms']) / base['p50_ms'] * 100:+.1f}%"
+        print(line)
+    for stage, messages in results['errors'].items():
+        print(f"! {stage} failed: {'; '.join(messages)}", file=sys.stderr)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--corpus-dir', default='bench_corpus', help="Where the synthetic corpus is generated")
+    parser.add_argument('--seed', type=int, default=1234, help="Corpus seed, keep fixed to compare runs")
+    parser.add_argument('--repeat', type=int, default=3, help="Passes over the corpus")
+    parser.add_argument('--kinds', default=','.join(DOCUMENT_KINDS), help="Comma-separated document kinds to include")
+    parser.add_argument('--sizes', default=','.join(SIZE_CLASSES), help="Comma-separated size classes to include")
+    parser.add_argument('--output', default='benchmark_results.json', help="Machine-readable results file")
+    parser.add_argument('--compare', help="Previous results file to compare p50 latencies against")
+    parser.add_argument('--verbose', action='store_true', help="Show pipeline logging")
+    args = parser.parse_args()
+
+    # Stage failures are summarized at the end instead of logged with tracebacks
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.CRITICAL)
+    kinds = [kind for kind in args.kinds.split(',') if kind]
+    sizes = {size: SIZE_CLASSES[size] for size in args.sizes.split(',') if size}
+
+    manifest = build_corpus(args.corpus_dir, args.seed, kinds, sizes)
+    results = run_benchmark(manifest, args.repeat)
+    results['environment'] = environment_info()
+    results['config'] = {'seed': args.seed, 'repeat': args.repeat, 'corpus': manifest}
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_report(results, baseline)
+    print(f"\nResults written to {args.output}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,289 @@
+import os
+import logging
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Defaults tuned for pages rendered at ~200 DPI
+COPY_MOVE_BLOCK_SIZE = int(os.environ.get('COPY_MOVE_BLOCK_SIZE', 16))
+COPY_MOVE_MIN_OFFSET = int(os.environ.get('COPY_MOVE_MIN_OFFSET', 32))
+COPY_MOVE_MIN_REGION_SIZE = int(os.environ.get('COPY_MOVE_MIN_REGION_SIZE', 48))
+COPY_MOVE_MIN_BLOCKS = int(os.environ.get('COPY_MOVE_MIN_BLOCKS', 20))
+
+# Repeated text, form rules and blank lines are ink on plain paper with a
+# gray-level entropy of one or two bits. Pasted scans, photos and stamps carry
+# far more, so regions below this many bits are treated as layout, not tampering
+COPY_MOVE_MIN_ENTROPY = float(os.environ.get('COPY_MOVE_MIN_ENTROPY', 2.5))
+
+# A match found on a downscaled image is kept if the full resolution copies
+# differ by at most this much on average (in gray levels)
+COPY_MOVE_MAX_MEAN_DIFF = float(os.environ.get('COPY_MOVE_MAX_MEAN_DIFF', 8.0))
+
+# Only blocks whose hash is divisible by this are indexed. The choice depends on
+# block content alone, so both copies of a duplicated region keep the same blocks
+SAMPLE_RATE = 8
+
+# Blocks repeated more often than this are common glyphs/rules, not evidence of copying
+MAX_GROUP_SIZE = 16
+
+# Blocks with less intensity variance than this are background and are ignored
+MIN_BLOCK_VARIANCE = 100.0
+
+# Quantization shift applied before hashing so faint noise does not break matches
+QUANTIZE_SHIFT = 3
+
+# Odd bases for the polynomial block hash along x and y
+HASH_BASE_X = 0x9E3779B1
+HASH_BASE_Y = 0x85EBCA77
+
+def _powers(base, count):
+    """Powers base**k and base**-k modulo 2**32 for k in range(count)"""
+    inverse = pow(base, -1, 2**32)
+    powers = np.cumprod(np.r_[1, np.full(count - 1, base, dtype=np.uint64)], dtype=np.uint64) % 2**32
+    inverse_powers = np.cumprod(np.r_[1, np.full(count - 1, inverse, dtype=np.uint64)], dtype=np.uint64) % 2**32
+    return powers.astype(np.uint32), inverse_powers.astype(np.uint32)
+
+def _window_hash(values, block_size, base, axis):
+    """Polynomial hash of every block_size window along an axis, using prefix sums"""
+    values = np.moveaxis(values, axis, -1)
+    length = values.shape[-1]
+    powers, inverse_powers = _powers(base, length)
+
+    # prefix[k] = sum(values[:k] * base**index), so a window is a difference of prefixes
+    prefix = np.zeros(values.shape[:-1] + (length + 1,), dtype=np.uint32)
+    np.cumsum(values * powers, axis=-1, dtype=np.uint32, out=prefix[..., 1:])
+    windows = prefix[..., block_size:] - prefix[..., :-block_size]
+
+    # Shift every window back to start at base**0 so equal blocks get equal hashes
+    windows *= inverse_powers[:length - block_size + 1]
+    return np.moveaxis(windows, -1, axis)
+
+def hash_blocks(gray, block_size):
+    """
+    Hash every block_size x block_size block of a grayscale image (stride 1)
+    Returns an array of shape (h - block_size + 1, w - block_size + 1)
+    """
+    quantized = (gray >> QUANTIZE_SHIFT).astype(np.uint32)
+
+    # Separable polynomial hash with wrap-around uint32 arithmetic
+    row_hashes = _window_hash(quantized, block_size, HASH_BASE_X, axis=1)
+    return _window_hash(row_hashes, block_size, HASH_BASE_Y, axis=0)
+
+def block_variance(gray, block_size):
+    """Intensity variance of every block, computed with box filters"""
+    values = gray.astype(np.float32)
+    size = (block_size, block_size)
+    # Anchor at the top-left so entry (y, x) describes the block starting there
+    mean = cv2.boxFilter(values, -1, size, anchor=(0, 0), borderType=cv2.BORDER_REPLICATE)
+    mean_square = cv2.boxFilter(values * values, -1, size, anchor=(0, 0), borderType=cv2.BORDER_REPLICATE)
+    out_h, out_w = gray.shape[0] - block_size + 1, gray.shape[1] - block_size + 1
+    return (mean_square - mean * mean)[:out_h, :out_w]
+
+def region_entropy(gray, box):
+    """Shannon entropy (bits) of the 32-level gray histogram inside a box"""
+    x, y, w, h = box
+    values = gray[y:y + h, x:x + w]
+    if values.size == 0:
+        return 0.0
+    histogram = np.bincount((values >> 3).ravel(), minlength=32) / values.size
+    histogram = histogram[histogram > 0]
+    return float(-(histogram * np.log2(histogram)).sum())
+
+def _overlaps(box, other, min_fraction=0.5):
+    """True if the boxes share at least min_fraction of the smaller one's area"""
+    x, y, w, h = box
+    other_x, other_y, other_w, other_h = other
+    overlap_w = min(x + w, other_x + other_w) - max(x, other_x)
+    overlap_h = min(y + h, other_y + other_h) - max(y, other_y)
+    if overlap_w <= 0 or overlap_h <= 0:
+        return False
+    return overlap_w * overlap_h >= min_fraction * min(w * h, other_w * other_h)
+
+def drop_layout_repetition(gray, regions, min_entropy=COPY_MOVE_MIN_ENTROPY):
+    """
+    Remove matches that are ordinary document layout rather than copy-paste:
+    low-entropy text and rules, and content repeated at more than one offset
+    (initials lines, footers, side-by-side signature blocks)
+    """
+    kept = []
+    for region in regions:
+        if region_entropy(gray, region["source"]) < min_entropy:
+            continue
+        repeated = any(
+            other["offset"] != region["offset"] and
+            any(_overlaps(box, other_box) for box in (region["source"], region["target"])
+                for other_box in (other["source"], other["target"]))
+            for other in regions
+        )
+        if not repeated:
+            kept.append(region)
+    return kept
+
+def find_copy_move_regions(gray, block_size=COPY_MOVE_BLOCK_SIZE, min_offset=COPY_MOVE_MIN_OFFSET,
+                           min_region_size=COPY_MOVE_MIN_REGION_SIZE, min_blocks=COPY_MOVE_MIN_BLOCKS):
+    """
+    Find regions of a grayscale page that were duplicated elsewhere on the page
+
+    Identical blocks are found by hashing, grouped by the offset between the two
+    copies, and split into spatially connected regions. Each returned region is a
+    dict with the source and target boxes as (x, y, w, h), the offset and the
+    number of matching blocks supporting it. Repeated text and form layout
+    is not reported (see drop_layout_repetition).
+    """
+    h, w = gray.shape[:2]
+    if h < block_size * 2 or w < block_size * 2:
+        return []
+
+    block_hashes = hash_blocks(gray, block_size)
+    textured = block_variance(gray, block_size) > MIN_BLOCK_VARIANCE
+
+    ys, xs = np.nonzero(textured & (block_hashes % SAMPLE_RATE == 0))
+    if len(ys) < 2:
+        return []
+    hashes = block_hashes[ys, xs]
+
+    # Sort blocks by hash so identical blocks become neighbours
+    order = np.argsort(hashes, kind='stable')
+    hashes, ys, xs = hashes[order], ys[order], xs[order]
+
+    # Identify runs of equal hashes and drop overly common ones
+    run_starts = np.flatnonzero(np.r_[True, hashes[1:] != hashes[:-1]])
+    run_lengths = np.diff(np.r_[run_starts, len(hashes)])
+    run_ids = np.repeat(np.arange(len(run_starts)), run_lengths)
+    keep = np.repeat(run_lengths <= MAX_GROUP_SIZE, run_lengths)
+
+    # Pair every block with the later blocks in its run
+    src_y, src_x, dst_y, dst_x = [], [], [], []
+    for distance in range(1, MAX_GROUP_SIZE):
+        if distance >= len(hashes):
+            break
+        pair = (run_ids[:-distance] == run_ids[distance:]) & keep[:-distance]
+        if not pair.any():
+            break
+        first = np.flatnonzero(pair)
+        second = first + distance
+        src_y.append(ys[first])
+        src_x.append(xs[first])
+        dst_y.append(ys[second])
+        dst_x.append(xs[second])
+
+    if not src_y:
+        return []
+
+    src_y, src_x = np.concatenate(src_y).astype(np.int64), np.concatenate(src_x).astype(np.int64)
+    dst_y, dst_x = np.concatenate(dst_y).astype(np.int64), np.concatenate(dst_x).astype(np.int64)
+
+    # Orient each pair so the offset points down (or right on the same row)
+    swap = (dst_y < src_y) | ((dst_y == src_y) & (dst_x < src_x))
+    src_y, dst_y = np.where(swap, dst_y, src_y), np.where(swap, src_y, dst_y)
+    src_x, dst_x = np.where(swap, dst_x, src_x), np.where(swap, src_x, dst_x)
+    offset_y, offset_x = dst_y - src_y, dst_x - src_x
+
+    far_enough = offset_x ** 2 + offset_y ** 2 >= min_offset ** 2
+    src_y, src_x, offset_y, offset_x = src_y[far_enough], src_x[far_enough], offset_y[far_enough], offset_x[far_enough]
+    if len(src_y) < min_blocks:
+        return []
+
+    # Spatial hash index: bucket matched blocks by their shift vector
+    offset_keys = offset_y * (2 * w + 1) + (offset_x + w)
+    _, inverse, counts = np.unique(offset_keys, return_inverse=True, return_counts=True)
+    supported = counts[inverse] >= min_blocks
+    if not supported.any():
+        return []
+
+    order = np.flatnonzero(supported)
+    order = order[np.argsort(inverse[order], kind='stable')]
+    bucket_starts = np.flatnonzero(np.r_[True, np.diff(inverse[order]) != 0])
+
+    regions = []
+    grid_shape = (h // block_size + 1, w // block_size + 1)
+    for members in np.split(order, bucket_starts[1:]):
+        dy, dx = int(offset_y[members[0]]), int(offset_x[members[0]])
+        cell_y, cell_x = src_y[members] // block_size, src_x[members] // block_size
+
+        # Split blocks sharing this shift into spatially connected regions
+        grid = np.zeros(grid_shape, dtype=np.uint8)
+        grid[cell_y, cell_x] = 1
+        _, labels = cv2.connectedComponents(grid, connectivity=8)
+        member_labels = labels[cell_y, cell_x]
+
+        for label in np.unique(member_labels):
+            in_region = member_labels == label
+            if np.count_nonzero(in_region) < min_blocks:
+                continue
+            region_y, region_x = src_y[members][in_region], src_x[members][in_region]
+            x0, y0 = int(region_x.min()), int(region_y.min())
+            region_w = int(region_x.max()) - x0 + block_size
+            region_h = int(region_y.max()) - y0 + block_size
+            if region_w < min_region_size or region_h < min_region_size:
+                continue
+
+            regions.append({
+                "source": (x0, y0, region_w, region_h),
+                "target": (x0 + dx, y0 + dy, region_w, region_h),
+                "offset": (dx, dy),
+                "blocks": int(np.count_nonzero(in_region))
+            })
+
+    regions = drop_layout_repetition(gray, regions)
+    regions.sort(key=lambda region: region["blocks"], reverse=True)
+    return regions
+
+def confirm_region(gray, region, scale, max_mean_diff=COPY_MOVE_MAX_MEAN_DIFF):
+    """
+    Check a region found on a copy of gray downscaled by scale against the full
+    resolution image, searching around the scaled-up offset for the best match.
+    Returns the region in full resolution coordinates, or None if the copies differ
+    """
+    h, w = gray.shape[:2]
+    x, y, region_w, region_h = (int(round(value / scale)) for value in region["source"])
+    region_w, region_h = min(region_w, w - x), min(region_h, h - y)
+    dx, dy = (int(round(value / scale)) for value in region["offset"])
+    # Compare every other full resolution pixel; plenty to tell a copy from a near miss
+    source = gray[y:y + region_h:2, x:x + region_w:2]
+    
+    best = None
+    radius = int(np.ceil(1 / scale))
+    for shift_y in range(dy - radius, dy + radius + 1):
+        for shift_x in range(dx - radius, dx + radius + 1):
+            target_x, target_y = x + shift_x, y + shift_y
+            if target_x < 0 or target_y < 0 or target_x + region_w > w or target_y + region_h > h:
+                continue
+            if shift_x == 0 and shift_y == 0:
+                continue
+            target = gray[target_y:target_y + region_h:2, target_x:target_x + region_w:2]
+            diff = cv2.absdiff(source, target).mean()
+            if best is None or diff < best[0]:
+                best = (diff, shift_x, shift_y)
+    
+    if best is None or best[0] > max_mean_diff:
+        return None
+    _, dx, dy = best
+    return {
+        "source": (x, y, region_w, region_h),
+        "target": (x + dx, y + dy, region_w, region_h),
+        "offset": (dx, dy),
+        "blocks": region["blocks"]
+    }
+
+def find_copy_move_regions_scaled(gray, scale):
+    """
+    find_copy_move_regions on a copy of gray downscaled by scale, with pixel
+    thresholds scaled to match and every region confirmed at full resolution
+    """
+    if scale >= 1.0:
+        return find_copy_move_regions(gray)
+    
+    small = cv2.resize(gray, (max(1, round(gray.shape[1] * scale)), max(1, round(gray.shape[0] * scale))),
+                       interpolation=cv2.INTER_AREA)
+    candidates = find_copy_move_regions(
+        small,
+        min_offset=max(1, round(COPY_MOVE_MIN_OFFSET * scale)),
+        min_region_size=max(COPY_MOVE_BLOCK_SIZE, round(COPY_MOVE_MIN_REGION_SIZE * scale)),
+        min_blocks=max(4, round(COPY_MOVE_MIN_BLOCKS * scale * scale))
+    )
+    regions = [region for region in (confirm_region(gray, candidate, scale) for candidate in candidates)
+               if region is not None]
+    logger.debug(f"Confirmed {len(regions)} of {len(candidates)} copy-move candidates at full resolution")
+    return regions
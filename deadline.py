@@ -0,0 +1,24 @@
+import os
+import time
+
+# Every analysis must finish within this many seconds of starting; the web
+# server's worker timeout (gunicorn.conf.py) is derived from it
+ANALYSIS_DEADLINE = float(os.environ.get('ANALYSIS_DEADLINE', 300))
+# A /api/batch request stops analyzing after this many seconds and reports the
+# documents it did not get to, so they can be submitted again
+BATCH_DEADLINE = float(os.environ.get('BATCH_DEADLINE', 600))
+
+class AnalysisDeadlineExceeded(TimeoutError):
+    """Raised when an analysis does not finish within its deadline"""
+    pass
+
+def time_left(deadline):
+    """Seconds left before a time.monotonic() deadline, or None if there is no deadline"""
+    if deadline is None:
+        return None
+    return max(0.0, deadline - time.monotonic())
+
+def check_deadline(deadline, message="Analysis deadline passed"):
+    """Raise AnalysisDeadlineExceeded if the deadline has passed, so long-running work can stop"""
+    if deadline is not None and time.monotonic() >= deadline:
+        raise AnalysisDeadlineExceeded(message)
@@ -0,0 +1,108 @@
+import io
+import os
+import logging
+import hashlib
+import tempfile
+import threading
+import PyPDF2
+
+logger = logging.getLogger(__name__)
+
+class Document:
+    """
+    An uploaded document held in memory
+
+    The raw bytes are read once and shared by every extractor and detector:
+    streams over them are zero-copy, the PDF is parsed at most once, and the
+    bytes are only written to disk if a tool that needs a path (poppler) asks.
+    """
+
+    def __init__(self, data, filename, source_path=None):
+        self.data = bytes(data)
+        self.filename = filename
+        self.extension = os.path.splitext(filename)[1].lower()
+        self.source_path = source_path
+        self.page_texts = None  # text of each PDF page, set once text has been extracted
+        self.lock = threading.Lock()
+        self.closed = False
+        self._pdf_reader = None
+        self._spill_path = None
+        self._digest = None
+
+    @classmethod
+    def from_path(cls, file_path, filename=None):
+        """Read a document from disk, keeping the file as its on-disk copy"""
+        with open(file_path, 'rb') as f:
+            return cls(f.read(), filename or os.path.basename(file_path), source_path=file_path)
+
+    @classmethod
+    def from_upload(cls, file, filename=None):
+        """Read an uploaded werkzeug FileStorage into memory"""
+        return cls(file.read(), filename or file.filename)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return len(self.data)
+
+    @property
+    def buffer(self):
+        """Read-only memoryview over the raw bytes"""
+        return memoryview(self.data)
+
+    def stream(self):
+        """New file-like object over the raw bytes (shares the buffer, no copy)"""
+        return io.BytesIO(self.data)
+
+    @property
+    def digest(self):
+        """SHA-256 digest of the document contents"""
+        if self._digest is None:
+            self._digest = hashlib.sha256(self.buffer).hexdigest()
+        return self._digest
+
+    @property
+    def pdf_reader(self):
+        """Parsed PdfReader for the document, created on first use"""
+        with self.lock:
+            if self._pdf_reader is None:
+                self._pdf_reader = PyPDF2.PdfReader(self.stream())
+            return self._pdf_reader
+
+    @property
+    def path(self):
+        """Path to a copy on disk, written to a temporary file the first time it is needed"""
+        if self.source_path is not None:
+            return self.source_path
+        with self.lock:
+            if self._spill_path is None:
+                # Work still running after the request gave up must not leave copies behind
+                if self.closed:
+                    raise ValueError(f"{self.filename} is closed and can no longer be written to disk")
+                fd, spill_path = tempfile.mkstemp(suffix=self.extension)
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(self.buffer)
+                logger.debug(f"Spilled {self.filename} to {spill_path} for tools that need a path")
+                self._spill_path = spill_path
+            return self._spill_path
+
+    def close(self):
+        """Remove the temporary copy on disk, if one was written, and refuse to write another"""
+        with self.lock:
+            self.closed = True
+            if self._spill_path is not None:
+                try:
+                    os.remove(self._spill_path)
+                except OSError as e:
+                    logger.error(f"Error cleaning up file: {str(e)}")
+                self._spill_path = None
+
+def as_document(document):
+    """Accept a Document or a file path and return a Document"""
+    if isinstance(document, Document):
+        return document
+    return Document.from_path(document)
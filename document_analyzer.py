@@ -1,20 +1,151 @@
 import logging
 import re
+import threading
+from collections import namedtuple
 from datetime import datetime
 import spacy
 import os
 
+from keyword_matcher import KeywordAutomaton
+from metrics import stage_timer
+
 # Initialize logging
 logger = logging.getLogger(__name__)
 
-# Load spaCy NLP model
-try:
-    nlp = spacy.load("en_core_web_sm")
-except:
-    logger.warning("Could not load en_core_web_sm model. Using en_core_web_sm with basic components.")
-    nlp = spacy.blank("en")
-    for component in ["tok2vec", "tagger", "parser", "ner", "attribute_ruler", "lemmatizer"]:
-        nlp.add_pipe(component)
+# spaCy model and the components left out of it. Only doc.ents and doc.text are
+# used, so by default everything but tokenization and NER is excluded; the shared
+# tok2vec only feeds the tagger and parser, as NER in the en_core_web models has its own
+NLP_MODEL = os.environ.get('NLP_MODEL', 'en_core_web_sm')
+NLP_EXCLUDE = [name.strip() for name in
+               os.environ.get('NLP_EXCLUDE', 'tok2vec,parser,lemmatizer,tagger,attribute_ruler,senter').split(',')
+               if name.strip()]
+NLP_BATCH_SIZE = int(os.environ.get('NLP_BATCH_SIZE', 8))
+
+# Long documents are run through the pipeline in overlapping chunks of this many
+# characters, optionally spread over several processes
+NLP_CHUNK_SIZE = int(os.environ.get('NLP_CHUNK_SIZE', 20000))
+NLP_CHUNK_OVERLAP = int(os.environ.get('NLP_CHUNK_OVERLAP', 500))
+NLP_PROCESSES = int(os.environ.get('NLP_PROCESSES', 1))
+
+_nlp = None
+_nlp_lock = threading.Lock()
+
+def _load_nlp():
+    """Load the spaCy pipeline without the excluded components"""
+    try:
+        nlp = spacy.load(NLP_MODEL, exclude=NLP_EXCLUDE)
+    except:
+        logger.warning(f"Could not load {NLP_MODEL} model. Using blank English model with basic components.")
+        nlp = spacy.blank("en")
+        for component in ["tok2vec", "tagger", "parser", "ner", "attribute_ruler", "lemmatizer"]:
+            if component not in NLP_EXCLUDE:
+                nlp.add_pipe(component)
+    logger.info(f"Loaded spaCy pipeline with components: {', '.join(nlp.pipe_names)}")
+    return nlp
+
+def get_nlp():
+    """Return the shared spaCy pipeline, loading it on first use"""
+    global _nlp
+    if _nlp is None:
+        with _nlp_lock:
+            if _nlp is None:
+                _nlp = _load_nlp()
+    return _nlp
+
+def preload_nlp():
+    """Load the spaCy pipeline up front, e.g. in the server master before workers fork"""
+    get_nlp()
+
+# Entity found in a chunk, with offsets into the full document text
+Entity = namedtuple('Entity', ['text', 'label_', 'start_char', 'end_char'])
+
+class ChunkedDoc:
+    """The full document text and the entities merged from all of its chunks"""
+
+    def __init__(self, text, ents):
+        self.text = text
+        self.ents = ents
+
+def split_into_chunks(text, chunk_size=NLP_CHUNK_SIZE, overlap=NLP_CHUNK_OVERLAP):
+    """
+    Split text into overlapping (start, end) ranges of at most chunk_size characters
+
+    Chunks end after the last sentence break in their second half when there is
+    one (otherwise at a space), and the next chunk starts overlap characters
+    earlier on a word boundary.
+    """
+    if len(text) <= chunk_size:
+        return [(0, len(text))]
+
+    chunks = []
+    start = 0
+    while True:
+        end = start + chunk_size
+        if end >= len(text):
+            chunks.append((start, len(text)))
+            return chunks
+
+        cut = text.rfind('. ', start + chunk_size // 2, end)
+        if cut != -1:
+            end = cut + 2
+        else:
+            cut = text.rfind(' ', start + chunk_size // 2, end)
+            if cut != -1:
+                end = cut + 1
+        chunks.append((start, end))
+
+        # Step back into the previous chunk, starting the next one on a word
+        next_start = max(end - overlap, start + 1)
+        space = text.find(' ', next_start, end)
+        start = space + 1 if space != -1 else next_start
+
+def _merge_entities(chunk_ranges, chunk_entities):
+    """
+    Merge per-chunk entities into one list with document offsets
+
+    Where two chunks overlap, entities starting before the middle of the overlap
+    are taken from the earlier chunk and the rest from the later one, so each
+    entity is kept exactly once.
+    """
+    ents = []
+    for index, ((start, end), entities) in enumerate(zip(chunk_ranges, chunk_entities)):
+        lower = 0 if index == 0 else (start + chunk_ranges[index - 1][1]) // 2
+        upper = (chunk_ranges[index + 1][0] + end) // 2 if index + 1 < len(chunk_ranges) else end
+        ents.extend(entity for entity in entities if lower <= entity.start_char < upper)
+    return ents
+
+def process_texts(texts, batch_size=NLP_BATCH_SIZE, n_process=NLP_PROCESSES):
+    """
+    Run cleaned texts through the NLP pipeline in chunks and return a ChunkedDoc per text
+
+    Chunks of all texts are streamed through a single nlp.pipe call, so peak
+    memory is bounded by the chunk size rather than the document length.
+    """
+    texts = list(texts)
+    chunk_ranges = [split_into_chunks(text) for text in texts]
+    chunk_entities = [[] for ranges in chunk_ranges for _ in ranges]
+
+    chunks = []
+    for text, ranges in zip(texts, chunk_ranges):
+        for start, end in ranges:
+            chunks.append((text[start:end], start))
+
+    nlp = get_nlp()
+    with stage_timer('nlp'):
+        for chunk_index, (doc, offset) in enumerate(nlp.pipe(chunks, as_tuples=True,
+                                                             batch_size=batch_size, n_process=n_process)):
+            chunk_entities[chunk_index] = [
+                Entity(ent.text, ent.label_, offset + ent.start_char, offset + ent.end_char)
+                for ent in doc.ents
+            ]
+
+    docs = []
+    position = 0
+    for text, ranges in zip(texts, chunk_ranges):
+        entities = chunk_entities[position:position + len(ranges)]
+        position += len(ranges)
+        docs.append(ChunkedDoc(text, _merge_entities(ranges, entities)))
+    return docs
 
 # Key legal terms to look for
 LEGAL_TERMS = [
@@ -27,6 +158,9 @@ LEGAL_TERMS = [
     "fee", "subscription", "cancellation", "refund", "consent"
 ]
 
+# All legal terms matched in a single pass over each paragraph
+LEGAL_TERMS_MATCHER = KeywordAutomaton(LEGAL_TERMS)
+
 def clean_text(text):
     """Clean the text by removing excessive whitespace and special characters"""
     text = re.sub(r'\s+', ' ', text)
@@ -116,12 +250,8 @@ def extract_key_clauses(doc):
         if len(paragraph) < 10:  # Skip very short paragraphs
             continue
             
-        # Check if paragraph contains important legal terms
-        importance_score = 0
-        for term in LEGAL_TERMS:
-            term_pattern = r'\b' + re.escape(term) + r'\b'
-            if re.search(term_pattern, paragraph, re.IGNORECASE):
-                importance_score += 1
+        # Score the paragraph by how many different legal terms it contains
+        importance_score = len(LEGAL_TERMS_MATCHER.distinct_terms(paragraph))
         
         # If the paragraph contains multiple legal terms, consider it important
         if importance_score >= 2:
@@ -223,16 +353,8 @@ def summarize_document(doc, parties, dates, key_clauses, payment_terms, terminat
     
     return summary
 
-def analyze_document(text, file_path=None):
-    """Analyze the document text and return structured information"""
-    logger.info("Starting document analysis")
-    
-    # Clean the text
-    text = clean_text(text)
-    
-    # Process with spaCy
-    doc = nlp(text[:100000])  # Limit to first 100k chars to avoid memory issues
-    
+def _build_results(doc):
+    """Extract the structured analysis from a processed document"""
     # Extract information
     dates = extract_dates(doc)
     parties = extract_parties(doc)
@@ -252,7 +374,7 @@ def analyze_document(text, file_path=None):
         })
     
     # Combine everything
-    results = {
+    return {
         "summary": summary,
         "parties": parties,
         "dates": dates,
@@ -261,6 +383,28 @@ def analyze_document(text, file_path=None):
         "termination_clauses": termination_clauses,
         "key_terms": key_terms
     }
+
+def analyze_document(text, file_path=None):
+    """Analyze the document text and return structured information"""
+    logger.info("Starting document analysis")
+    
+    # Clean the text
+    text = clean_text(text)
+    
+    # Process with spaCy in chunks so the whole document is covered
+    doc = process_texts([text])[0]
+    
+    results = _build_results(doc)
     
     logger.info("Document analysis completed")
     return results
+
+def analyze_documents(texts, batch_size=NLP_BATCH_SIZE):
+    """Analyze several document texts in batches through nlp.pipe, returning results in order"""
+    logger.info("Starting batch document analysis")
+    
+    docs = process_texts([clean_text(text) for text in texts], batch_size=batch_size)
+    results = [_build_results(doc) for doc in docs]
+    
+    logger.info(f"Batch document analysis completed for {len(results)} documents")
+    return results
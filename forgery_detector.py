@@ -1,16 +1,69 @@
 import os
 import logging
 import re
+import threading
+import time
+import contextvars
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 import cv2
 import numpy as np
 from PIL import Image
-import pytesseract
-import PyPDF2
-import pdf2image
-import tempfile
+
+from page_images import PageImageProvider
+from document import Document, as_document
+from metrics import stage_timer
+from ocr_cache import ocr_image
+from copy_move_detector import find_copy_move_regions_scaled
 
 logger = logging.getLogger(__name__)
 
+# Which PDF pages get signature and manipulation checks: "all", "signature"
+# (the first and last pages plus any page mentioning signing) or "last"
+# (the first and last pages). Pages are checked most likely first, in
+# parallel, until the per-document budget runs out or the risk score is 1.0
+FORGERY_PAGE_POLICY = os.environ.get('FORGERY_PAGE_POLICY', 'all')
+FORGERY_LAST_PAGES = int(os.environ.get('FORGERY_LAST_PAGES', 3))
+FORGERY_PAGE_WORKERS = int(os.environ.get('FORGERY_PAGE_WORKERS', os.cpu_count() or 2))
+FORGERY_TIME_BUDGET = float(os.environ.get('FORGERY_TIME_BUDGET', 60))
+
+# Each forgery alert adds this much to the risk score, up to 1.0
+ALERT_RISK = 0.2
+
+# Informational alerts that do not raise the risk score
+UNSCORED_ALERT_TYPES = {"analysis_incomplete"}
+
+SIGNATURE_PAGE_PATTERN = re.compile(
+    r'\b(?:sign(?:ed|ature|atures|atory)?|witness(?:eth)?|notar(?:y|ized)|executed|in\s+witness\s+whereof)\b',
+    re.IGNORECASE
+)
+SIGNATURE_REQUIRED_PATTERN = re.compile(r'\b(?:sign(?:ed|ature)|agree(?:d|ment))\b', re.IGNORECASE)
+MISSING_SIGNATURE_ALERT = "Document appears to require signatures, but no clear signatures detected."
+COPY_MOVE_ALERT = "Document appears to contain repeated elements, suggesting possible copy-paste manipulation"
+
+# Image checks look for candidates on a copy downscaled to at most the stage's
+# DPI and pixel count, then analyze what they find at full resolution. Pixel
+# thresholds are tuned for REFERENCE_DPI and scaled to the working resolution
+FORENSICS_MULTIRES = os.environ.get('FORENSICS_MULTIRES', '1') != '0'
+REFERENCE_DPI = 200
+SIGNATURE_SEARCH_DPI = int(os.environ.get('SIGNATURE_SEARCH_DPI', 100))
+SIGNATURE_MAX_PIXELS = int(os.environ.get('SIGNATURE_MAX_PIXELS', 2_000_000))
+# Copy-move matching hashes exact pixel blocks, and resampling only preserves
+# copies whose offset lines up with the new pixel grid, so it is only scaled
+# down for very large images by default
+COPY_MOVE_DPI = int(os.environ.get('COPY_MOVE_DPI', 600))
+COPY_MOVE_MAX_PIXELS = int(os.environ.get('COPY_MOVE_MAX_PIXELS', 16_000_000))
+ELA_MAX_PIXELS = int(os.environ.get('ELA_MAX_PIXELS', 4_000_000))
+
+# Photos carry no reliable DPI, so assume the longer side spans a letter page
+ASSUMED_PAGE_INCHES = 11.0
+
+# ELA samples are whole JPEG MCUs so recompression sees the same blocks as the full image
+ELA_TILE_SIZE = 256
+
+_page_executor = None
+_page_executor_lock = threading.Lock()
+
 def detect_font_inconsistencies(text):
     """
     Detect potential font inconsistencies in the text that might indicate forgery
@@ -57,55 +110,130 @@ def detect_font_inconsistencies(text):
     
     return alerts
 
-def check_signature_irregularities(image_path):
+def load_image(image):
+    """
+    Load a document image as a BGR array from a file path, Document, PIL image or array
+    """
+    if image is None:
+        return None
+    if isinstance(image, np.ndarray):
+        return image
+    if isinstance(image, Image.Image):
+        return cv2.cvtColor(np.array(image.convert('RGB')), cv2.COLOR_RGB2BGR)
+    if isinstance(image, Document):
+        # Decode straight from the in-memory bytes
+        return cv2.imdecode(np.frombuffer(image.buffer, dtype=np.uint8), cv2.IMREAD_COLOR)
+    return cv2.imread(image)
+
+def estimate_dpi(image, dpi=None):
+    """Resolution of a page image: the given DPI, or a guess from its size"""
+    if dpi:
+        return dpi
+    return max(image.shape[:2]) / ASSUMED_PAGE_INCHES
+
+def working_scale(image, dpi, target_dpi, max_pixels):
+    """Scale factor (at most 1) that brings an image down to target_dpi and max_pixels"""
+    if not FORENSICS_MULTIRES:
+        return 1.0
+    pixels = image.shape[0] * image.shape[1]
+    return min(1.0, target_dpi / dpi, (max_pixels / pixels) ** 0.5)
+
+def downscale(image, scale):
+    """Resize an image by scale (at most 1), returning it unchanged when scale is 1"""
+    if scale >= 1.0:
+        return image
+    size = (max(1, round(image.shape[1] * scale)), max(1, round(image.shape[0] * scale)))
+    return cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+
+def _threshold_region(gray, x, y, w, h, pad=8):
+    """Adaptive threshold of one box of a grayscale image, padded so the box matches a full-image pass"""
+    x0, y0 = max(0, x - pad), max(0, y - pad)
+    x1, y1 = min(gray.shape[1], x + w + pad), min(gray.shape[0], y + h + pad)
+    thresh = cv2.adaptiveThreshold(gray[y0:y1, x0:x1], 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+                                   cv2.THRESH_BINARY_INV, 11, 2)
+    return thresh[y - y0:y - y0 + h, x - x0:x - x0 + w]
+
+def find_signature_candidates(gray, dpi):
+    """
+    Boxes (x, y, w, h) of signature-sized shapes in a grayscale page, in full
+    resolution coordinates, found on a copy downscaled for the search
+    """
+    scale = working_scale(gray, dpi, SIGNATURE_SEARCH_DPI, SIGNATURE_MAX_PIXELS)
+    small = downscale(gray, scale)
+    size = dpi * scale / REFERENCE_DPI
+    
+    # Apply adaptive thresholding to find signature-like areas
+    thresh = cv2.adaptiveThreshold(small, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+                                   cv2.THRESH_BINARY_INV, 11, 2)
+    
+    # Find contours
+    contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    
+    candidates = []
+    for contour in contours:
+        x, y, w, h = cv2.boundingRect(contour)
+        aspect_ratio = w / h if h > 0 else 0
+        
+        # Signatures typically have certain characteristics
+        if 200 * size < w < 1000 * size and 20 * size < h < 200 * size and 1.5 < aspect_ratio < 10:
+            # Map the box back onto the full resolution image
+            x0, y0 = int(x / scale), int(y / scale)
+            x1 = min(gray.shape[1], int(np.ceil((x + w) / scale)))
+            y1 = min(gray.shape[0], int(np.ceil((y + h) / scale)))
+            candidates.append((x0, y0, x1 - x0, y1 - y0))
+    return candidates
+
+def check_signature_irregularities(image_path, dpi=None, text=None):
     """
     Analyze a document image to detect potential signature irregularities
+    Accepts a file path or an in-memory page image, rendered at dpi if known,
+    and the image's text if it has already been extracted
+    """
+    alerts, signatures_found, requires_signatures = _check_signatures(image_path, text, dpi)
+    if requires_signatures and not signatures_found:
+        alerts.append(MISSING_SIGNATURE_ALERT)
+    return alerts
+
+def _check_signatures(image_path, text=None, dpi=None):
+    """
+    Signature checks for one image, returning (alerts, signatures found, signatures required)
+    Whether the image calls for signatures is judged from text, OCR'd if not given,
+    and only when no signature was found
     """
     alerts = []
+    potential_signatures = []
+    requires_signatures = False
     
     try:
         # Load the image
-        image = cv2.imread(image_path)
+        image = load_image(image_path)
         if image is None:
             logger.error(f"Failed to load image: {image_path}")
-            return ["Could not analyze image for signature verification"]
+            return ["Could not analyze image for signature verification"], False, False
         
         # Convert to grayscale
         gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        dpi = estimate_dpi(gray, dpi)
         
-        # Apply adaptive thresholding to find signature-like areas
-        thresh = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, 
-                                      cv2.THRESH_BINARY_INV, 11, 2)
-        
-        # Find contours
-        contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        
-        # Filter contours to find potential signatures
-        potential_signatures = []
-        for contour in contours:
-            x, y, w, h = cv2.boundingRect(contour)
-            aspect_ratio = w / h if h > 0 else 0
+        # Search a downscaled copy, then examine each candidate at full resolution
+        for x, y, w, h in find_signature_candidates(gray, dpi):
+            signature_roi = _threshold_region(gray, x, y, w, h)
             
-            # Signatures typically have certain characteristics
-            if 200 < w < 1000 and 20 < h < 200 and 1.5 < aspect_ratio < 10:
-                signature_roi = thresh[y:y+h, x:x+w]
-                
-                # Check density of black pixels (signature should have certain density)
-                black_pixel_density = np.sum(signature_roi == 255) / (w * h)
-                
-                if 0.05 < black_pixel_density < 0.5:
-                    potential_signatures.append((x, y, w, h, signature_roi, black_pixel_density))
+            # Check density of black pixels (signature should have certain density)
+            black_pixel_density = np.count_nonzero(signature_roi == 255) / (w * h)
+            
+            if 0.05 < black_pixel_density < 0.5:
+                potential_signatures.append((x, y, w, h, signature_roi, black_pixel_density))
         
         # Analyze potential signatures
         if potential_signatures:
             # Check for pixel-level inconsistencies in signatures
-            for i, (x, y, w, h, roi, density) in enumerate(potential_signatures):
-                # Check for pixelation - look at pixel value transitions
-                edge_count = 0
-                for r in range(1, roi.shape[0]-1):
-                    for c in range(1, roi.shape[1]-1):
-                        if roi[r,c] != roi[r,c+1] or roi[r,c] != roi[r,c-1] or roi[r,c] != roi[r+1,c] or roi[r,c] != roi[r-1,c]:
-                            edge_count += 1
+            for x, y, w, h, roi, density in potential_signatures:
+                # Check for pixelation - count interior pixels that differ from any 4-neighbour
+                center = roi[1:-1, 1:-1]
+                edges = (center != roi[1:-1, 2:]) | (center != roi[1:-1, :-2]) | \
+                        (center != roi[2:, 1:-1]) | (center != roi[:-2, 1:-1])
+                edge_count = np.count_nonzero(edges)
                 
                 edge_density = edge_count / (w * h)
                 
@@ -115,11 +243,8 @@ def check_signature_irregularities(image_path):
                     break
                 
                 # Check for uniform borders that might indicate copy-paste
-                border_uniformity = True
-                for i in range(min(20, h-1)):
-                    if np.sum(roi[i,:] == 255) > 0:
-                        border_uniformity = False
-                        break
+                border_rows = max(1, round(20 * dpi / REFERENCE_DPI))
+                border_uniformity = not np.any(roi[:min(border_rows, h-1)] == 255)
                 
                 if border_uniformity:
                     alerts.append(f"Potential signature irregularity: unusually uniform borders suggest possible copying.")
@@ -127,206 +252,444 @@ def check_signature_irregularities(image_path):
             
             # If multiple signatures, check for exact duplicates
             if len(potential_signatures) > 1:
-                for i in range(len(potential_signatures)):
-                    for j in range(i+1, len(potential_signatures)):
-                        sig1 = cv2.resize(potential_signatures[i][4], (100, 50))
-                        sig2 = cv2.resize(potential_signatures[j][4], (100, 50))
-                        
-                        # Calculate similarity
-                        similarity = np.sum(sig1 == sig2) / (100 * 50)
-                        
-                        if similarity > 0.9:  # If more than 90% identical
-                            alerts.append("Multiple signatures appear nearly identical, suggesting possible copying.")
-                            break
+                # Resize every signature once and compare each against all later ones in a single batch
+                resized = np.stack([cv2.resize(sig[4], (100, 50)) for sig in potential_signatures])
+                for i in range(len(resized) - 1):
+                    # Calculate similarity
+                    similarity = np.count_nonzero(resized[i+1:] == resized[i], axis=(1, 2)) / (100 * 50)
+                    
+                    if np.any(similarity > 0.9):  # If more than 90% identical
+                        alerts.append("Multiple signatures appear nearly identical, suggesting possible copying.")
         else:
-            # If the document should have signatures but none detected
-            text = pytesseract.image_to_string(image)
-            if re.search(r'\b(?:sign(?:ed|ature)|agree(?:d|ment))\b', text, re.IGNORECASE):
-                if not potential_signatures:
-                    alerts.append("Document appears to require signatures, but no clear signatures detected.")
+            # Check whether the document should have signatures
+            if text is None:
+                text = ocr_image(image)
+            requires_signatures = bool(SIGNATURE_REQUIRED_PATTERN.search(text))
     
     except Exception as e:
         logger.error(f"Error in signature analysis: {str(e)}", exc_info=True)
         alerts.append("Error in signature analysis.")
     
-    return alerts
+    return alerts, bool(potential_signatures), requires_signatures
 
-def detect_image_manipulation(image_path):
+def error_level_analysis(image, quality=95):
+    """
+    Recompress an image as JPEG in memory and return the per-pixel difference
+    """
+    encoded, jpg_buffer = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not encoded:
+        return None
+    
+    # Load back the JPEG
+    jpg_image = cv2.imdecode(jpg_buffer, cv2.IMREAD_COLOR)
+    if jpg_image is None:
+        return None
+    
+    # Compute the difference
+    return cv2.absdiff(image, jpg_image)
+
+def ela_samples(image, max_pixels=None):
+    """
+    The image itself if it is within max_pixels, else a mosaic of evenly spaced
+    tiles aligned to the JPEG block grid covering about max_pixels
+    """
+    max_pixels = ELA_MAX_PIXELS if max_pixels is None else max_pixels
+    h, w = image.shape[:2]
+    tile = ELA_TILE_SIZE
+    if not FORENSICS_MULTIRES or h * w <= max_pixels or h < tile or w < tile:
+        return image
+    
+    per_side = max(1, int((max_pixels / (tile * tile)) ** 0.5))
+    # Tile origins are multiples of 16 so every tile starts on an MCU boundary
+    rows = np.unique(np.linspace(0, h - tile, min(per_side, h // tile)).astype(int) // 16 * 16)
+    cols = np.unique(np.linspace(0, w - tile, min(per_side, w // tile)).astype(int) // 16 * 16)
+    return np.vstack([np.hstack([image[y:y + tile, x:x + tile] for x in cols]) for y in rows])
+
+def detect_image_manipulation(image_path, dpi=None):
     """
     Detect potential image manipulation that might indicate document forgery
+    Accepts a file path or an in-memory page image, rendered at dpi if known
     """
-    alerts = []
+    return [f"{description}: {'; '.join(regions)}." if regions else description
+            for description, regions in image_manipulation_findings(image_path, dpi)]
+
+def image_manipulation_findings(image_path, dpi=None):
+    """
+    detect_image_manipulation as (description, regions) pairs, keeping the
+    where (the duplicated regions, if any) apart from the what
+    """
+    findings = []
     
     try:
         # Load the image
-        image = cv2.imread(image_path)
+        image = load_image(image_path)
         if image is None:
             logger.error(f"Failed to load image: {image_path}")
-            return ["Could not analyze image for manipulation detection"]
+            return [("Could not analyze image for manipulation detection", [])]
         
         # Convert to grayscale
         gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        dpi = estimate_dpi(gray, dpi)
         
-        # Apply error level analysis (ELA)
-        # Save as JPEG with quality 95
-        temp_jpg_path = os.path.join(tempfile.gettempdir(), "temp_ela.jpg")
-        cv2.imwrite(temp_jpg_path, image, [cv2.IMWRITE_JPEG_QUALITY, 95])
-        
-        # Load back the JPEG
-        jpg_image = cv2.imread(temp_jpg_path)
+        # Apply error level analysis (ELA) at full resolution, sampling large images
+        with stage_timer('error_level_analysis'):
+            ela_image = error_level_analysis(ela_samples(image))
         
-        # Compute the difference
-        if jpg_image is not None:
-            ela_image = cv2.absdiff(image, jpg_image)
-            
+        if ela_image is not None:
             # Calculate the average error level
             avg_error = np.mean(ela_image)
             
             # If the error level is unusually high, it might indicate manipulation
             if avg_error > 10:
-                alerts.append("Image analysis indicates possible digital manipulation of the document.")
-            
-            # Clean up
-            os.remove(temp_jpg_path)
+                findings.append(("Image analysis indicates possible digital manipulation of the document.", []))
         
-        # Check for copy-paste by looking for repeated patterns
-        # Use normalized cross-correlation for pattern detection
-        result = cv2.matchTemplate(gray, gray, cv2.TM_CCOEFF_NORMED)
-        threshold = 0.95
-        locations = np.where(result >= threshold)
+        # Check for copy-paste by looking for regions duplicated elsewhere on the page
+        # (searched at reduced resolution, with matches confirmed at full resolution)
+        with stage_timer('find_copy_move_regions'):
+            scale = working_scale(gray, dpi, COPY_MOVE_DPI, COPY_MOVE_MAX_PIXELS)
+            duplicated_regions = find_copy_move_regions_scaled(gray, scale)
         
-        # Filter out trivial matches (a region matching itself)
-        matches = []
-        for pt in zip(*locations[::-1]):
-            unique_match = True
-            for existing_pt in matches:
-                if abs(pt[0] - existing_pt[0]) < 5 and abs(pt[1] - existing_pt[1]) < 5:
-                    unique_match = False
-                    break
-            if unique_match:
-                matches.append(pt)
-        
-        # If there are multiple non-trivial matches, it might indicate copy-paste
-        if len(matches) > 5:
-            alerts.append("Document appears to contain repeated elements, suggesting possible copy-paste manipulation.")
+        if duplicated_regions:
+            region_descriptions = []
+            for region in duplicated_regions[:3]:
+                x, y, w, h = region["source"]
+                target_x, target_y, _, _ = region["target"]
+                region_descriptions.append(f"{w}x{h} px at ({x}, {y}) repeated at ({target_x}, {target_y})")
+            findings.append((COPY_MOVE_ALERT, region_descriptions))
         
     except Exception as e:
         logger.error(f"Error in image manipulation detection: {str(e)}", exc_info=True)
-        alerts.append("Error in image analysis.")
+        findings.append(("Error in image analysis.", []))
     
-    return alerts
+    return findings
 
-def check_metadata_inconsistencies(file_path):
+def check_metadata_inconsistencies(document):
     """
     Check for inconsistencies in document metadata
     """
     alerts = []
     
     try:
-        file_extension = os.path.splitext(file_path)[1].lower()
+        document = as_document(document)
         
-        if file_extension == '.pdf':
-            with open(file_path, 'rb') as f:
-                pdf_reader = PyPDF2.PdfReader(f)
+        if document.extension == '.pdf':
+            # Reuse the PdfReader parsed for text extraction
+            pdf_reader = document.pdf_reader
+            
+            if pdf_reader.metadata:
+                # Check for modification date vs creation date
+                created_date = pdf_reader.metadata.get('/CreationDate')
+                mod_date = pdf_reader.metadata.get('/ModDate')
                 
-                if pdf_reader.metadata:
-                    # Check for modification date vs creation date
-                    created_date = pdf_reader.metadata.get('/CreationDate')
-                    mod_date = pdf_reader.metadata.get('/ModDate')
+                if created_date and mod_date:
+                    # Extract dates from PDF date format
+                    created_match = re.search(r'D:(\d{14})', created_date)
+                    mod_match = re.search(r'D:(\d{14})', mod_date)
                     
-                    if created_date and mod_date:
-                        # Extract dates from PDF date format
-                        created_match = re.search(r'D:(\d{14})', created_date)
-                        mod_match = re.search(r'D:(\d{14})', mod_date)
+                    if created_match and mod_match:
+                        created_timestamp = created_match.group(1)
+                        mod_timestamp = mod_match.group(1)
                         
-                        if created_match and mod_match:
-                            created_timestamp = created_match.group(1)
-                            mod_timestamp = mod_match.group(1)
-                            
-                            # If modification date is earlier than creation date
-                            if mod_timestamp < created_timestamp:
-                                alerts.append("Document metadata shows modification date earlier than creation date, suggesting possible tampering.")
-                            
-                            # If dates are far apart, might be a modified document
-                            created_year = int(created_timestamp[:4])
-                            mod_year = int(mod_timestamp[:4])
-                            
-                            if abs(mod_year - created_year) > 5:
-                                alerts.append(f"Document was created in {created_year} but modified in {mod_year}, suggesting possible updates to original content.")
-                
-                # Check for inconsistent fonts across the document
-                fonts = set()
-                for page in pdf_reader.pages:
-                    if '/Resources' in page:
-                        resources = page['/Resources']
-                        if '/Font' in resources:
-                            for font in resources['/Font']:
-                                fonts.add(font)
-                
-                if len(fonts) > 5:
-                    alerts.append(f"Document uses {len(fonts)} different font types, suggesting possible cut-and-paste from multiple sources.")
+                        # If modification date is earlier than creation date
+                        if mod_timestamp < created_timestamp:
+                            alerts.append("Document metadata shows modification date earlier than creation date, suggesting possible tampering.")
+                        
+                        # If dates are far apart, might be a modified document
+                        created_year = int(created_timestamp[:4])
+                        mod_year = int(mod_timestamp[:4])
+                        
+                        if abs(mod_year - created_year) > 5:
+                            alerts.append(f"Document was created in {created_year} but modified in {mod_year}, suggesting possible updates to original content.")
+            
+            # Check for inconsistent fonts across the document
+            fonts = set()
+            for page in pdf_reader.pages:
+                if '/Resources' in page:
+                    resources = page['/Resources']
+                    if '/Font' in resources:
+                        for font in resources['/Font']:
+                            fonts.add(font)
+            
+            if len(fonts) > 5:
+                alerts.append(f"Document uses {len(fonts)} different font types, suggesting possible cut-and-paste from multiple sources.")
     
     except Exception as e:
         logger.error(f"Error checking metadata: {str(e)}", exc_info=True)
     
     return alerts
 
-def detect_forgery(document_text, file_path):
+def _get_page_executor():
+    """Thread pool shared by the per-page forgery checks, started on first use"""
+    global _page_executor
+    with _page_executor_lock:
+        if _page_executor is None:
+            _page_executor = ThreadPoolExecutor(max_workers=FORGERY_PAGE_WORKERS, thread_name_prefix='forgery')
+        return _page_executor
+
+def select_forgery_pages(page_count, page_texts=None, policy=None):
+    """
+    Choose the 1-based pages to check under a page policy, most likely to hold
+    a signature or tampering first: the first page, the last pages, pages that
+    mention signing, then (for "all") everything else in order
+    """
+    policy = policy or FORGERY_PAGE_POLICY
+    pages = [1] + list(range(max(2, page_count - FORGERY_LAST_PAGES + 1), page_count + 1))
+    if policy in ('all', 'signature') and page_texts:
+        pages += [page_number for page_number, page_text in enumerate(page_texts[:page_count], 1)
+                  if page_text and SIGNATURE_PAGE_PATTERN.search(page_text)]
+    if policy == 'all':
+        pages += range(1, page_count + 1)
+    elif policy not in ('signature', 'last'):
+        logger.warning(f"Unknown forgery page policy {policy!r}, checking the first and last pages")
+    return [page_number for page_number in dict.fromkeys(pages) if 1 <= page_number <= page_count]
+
+def _page_selected(page_number, page_count, page_text, policy=None):
+    """Whether select_forgery_pages picks a page, judged from that page's own text"""
+    policy = policy or FORGERY_PAGE_POLICY
+    if policy == 'all' or page_number == 1 or page_number > page_count - FORGERY_LAST_PAGES:
+        return True
+    return policy == 'signature' and bool(page_text) and bool(SIGNATURE_PAGE_PATTERN.search(page_text))
+
+class EarlyPageChecks:
+    """
+    Start the image checks of selected PDF pages as text extraction releases them
+
+    Installed as the page provider's release hook, so a scanned page is checked
+    with the image it was OCR'd from rather than rendered a second time, and
+    check_pdf_pages only collects the results. At most two pages per check
+    worker are held; OCR waits for room instead of piling up page images.
+    """
+
+    def __init__(self, page_images, budget=None, deadline=None):
+        budget = FORGERY_TIME_BUDGET if budget is None else budget
+        self.page_images = page_images
+        self.stop_at = time.monotonic() + budget
+        if deadline is not None:
+            self.stop_at = min(self.stop_at, deadline)
+        self.futures = {}  # page number -> future of its _check_page results
+        self.slots = threading.BoundedSemaphore(2 * FORGERY_PAGE_WORKERS)
+        page_images.release_hook = self.check_released_page
+
+    def check_released_page(self, page_number, image, page_text):
+        """Release hook: check a page whose text is known, taking over its image"""
+        if (page_text is None or page_number in self.futures
+                or not _page_selected(page_number, self.page_images.page_count, page_text)
+                or not self.slots.acquire(timeout=max(0.0, self.stop_at - time.monotonic()))):
+            image.close()
+            return
+
+        def finished(future):
+            image.close()
+            self.slots.release()
+
+        # Each check runs in a copy of this context so its stage timings are kept
+        future = _get_page_executor().submit(contextvars.copy_context().run, _check_page,
+                                             image, page_text, self.page_images.dpi)
+        self.futures[page_number] = future
+        future.add_done_callback(finished)
+
+    def cancel(self):
+        """Stop taking pages and drop checks that have not started"""
+        self.page_images.release_hook = None
+        for future in self.futures.values():
+            future.cancel()
+
+def _check_page(page_image, page_text, dpi):
+    """Signature and manipulation checks for one rendered PDF page (runs in the page pool)"""
+    image = load_image(page_image)
+    with stage_timer('check_signature_irregularities'):
+        signature_alerts, signatures_found, requires_signatures = _check_signatures(image, page_text, dpi)
+    with stage_timer('detect_image_manipulation'):
+        manipulation_findings = image_manipulation_findings(image, dpi)
+    return signature_alerts, manipulation_findings, signatures_found, requires_signatures
+
+def check_pdf_pages(page_images, page_numbers, page_texts=None, max_alerts=None, budget=None, deadline=None,
+                    early_checks=None):
     """
-    Main function to detect potential forgery in a document
+    Run the image checks over PDF pages in parallel and merge the findings
+
+    Pages already taken by early_checks (an EarlyPageChecks) are not checked
+    again; the rest are rendered a few at a time and freed once checked. Checking stops
+    after budget seconds or at the analysis deadline (a time.monotonic() value),
+    or once max_alerts distinct alerts have been found.
+    Returns (findings, pages checked, pages that could not be rendered,
+    signatures found, signatures required) where findings maps (alert type, description) to {page number: regions},
+    so the same finding on several pages is one entry however its regions differ.
+    """
+    budget = FORGERY_TIME_BUDGET if budget is None else budget
+    stop_at = time.monotonic() + budget
+    if deadline is not None:
+        stop_at = min(stop_at, deadline)
+    executor = _get_page_executor()
+    findings = {}
+    pages_checked = []
+    pages_unrendered = []
+    signatures_found = False
+    requires_signatures = False
+    pending = {}
+    if early_checks is not None:
+        # Later releases (of the pages checked below) must not start more checks
+        page_images.release_hook = None
+        pending = {early_checks.futures[page_number]: page_number
+                   for page_number in page_numbers if page_number in early_checks.futures}
+    early_pages = set(pending.values())
+    remaining = deque(page_number for page_number in page_numbers if page_number not in early_pages)
+    
+    try:
+        while remaining or pending:
+            if max_alerts is not None and len(findings) >= max_alerts:
+                logger.info(f"Forgery risk is at its maximum after {len(pages_checked)} pages, stopping early")
+                break
+            if time.monotonic() >= stop_at:
+                logger.info(f"Forgery time budget spent after {len(pages_checked)} pages")
+                break
+            
+            # Keep every worker busy with at most one rendered page queued behind it
+            free_slots = 2 * FORGERY_PAGE_WORKERS - len(pending)
+            if remaining and free_slots > 0:
+                batch = [remaining.popleft() for _ in range(min(free_slots, len(remaining)))]
+                page_images.render(batch)
+                for page_number in batch:
+                    page_image = page_images.get_page(page_number)
+                    if page_image is None:
+                        logger.warning(f"Page {page_number} could not be rendered for image checks")
+                        pages_unrendered.append(page_number)
+                        continue
+                    page_text = page_texts[page_number - 1] if page_texts and page_number <= len(page_texts) else None
+                    # Each check runs in a copy of this context so its stage timings are kept
+                    future = executor.submit(contextvars.copy_context().run, _check_page,
+                                             page_image, page_text, page_images.dpi)
+                    pending[future] = page_number
+            
+            if not pending:
+                continue
+            
+            done, _ = wait(pending, timeout=max(0.0, stop_at - time.monotonic()), return_when=FIRST_COMPLETED)
+            for future in done:
+                page_number = pending.pop(future)
+                signature_alerts, manipulation_findings, page_signatures, page_requires = future.result()
+                pages_checked.append(page_number)
+                signatures_found = signatures_found or page_signatures
+                requires_signatures = requires_signatures or page_requires
+                page_findings = [("signature_irregularity", alert, []) for alert in signature_alerts]
+                page_findings += [("image_manipulation", description, regions)
+                                  for description, regions in manipulation_findings]
+                for alert_type, description, regions in page_findings:
+                    findings.setdefault((alert_type, description), {})[page_number] = regions
+                page_images.release([page_number])
+    finally:
+        for future in pending:
+            future.cancel()
+    
+    return findings, sorted(pages_checked), sorted(pages_unrendered), signatures_found, requires_signatures
+
+def _page_list(page_numbers):
+    """'page 3' or 'pages 2, 4' for a sorted list of page numbers"""
+    if len(page_numbers) == 1:
+        return f"page {page_numbers[0]}"
+    return f"pages {', '.join(str(page_number) for page_number in page_numbers)}"
+
+def _describe_pages(description, page_regions):
+    """One alert for a finding on several pages, listing the pages and then each page's regions"""
+    page_numbers = sorted(page_regions)
+    alert = f"{description.rstrip('.')} ({_page_list(page_numbers)})."
+    regions = [f"page {page_number}: {'; '.join(page_regions[page_number])}"
+               for page_number in page_numbers if page_regions[page_number]]
+    if regions:
+        alert += f" Regions: {' | '.join(regions)}."
+    return alert
+
+def detect_forgery(document_text, document, page_images=None, deadline=None, early_checks=None):
+    """
+    Main function to detect potential forgery in a document (a Document or a file path)
+    PDF pages are taken from page_images when the caller has already rendered them,
+    and the checks early_checks started during text extraction are reused;
+    page checks stop at the analysis deadline (a time.monotonic() value) if given
     """
     alerts = []
+    details = []  # Structured copy of each alert for storage and aggregation
     risk_score = 0.0
     
+    def add_alerts(alert_type, new_alerts, risk_level="medium"):
+        alerts.extend(new_alerts)
+        details.extend({"type": alert_type, "risk_level": risk_level, "description": alert} for alert in new_alerts)
+    
     # Check for font inconsistencies in the text
-    text_alerts = detect_font_inconsistencies(document_text)
-    alerts.extend(text_alerts)
+    with stage_timer('detect_font_inconsistencies'):
+        text_alerts = detect_font_inconsistencies(document_text)
+    add_alerts("font_inconsistency", text_alerts)
     
-    # If the file exists, perform image-based checks
-    if os.path.exists(file_path):
-        file_extension = os.path.splitext(file_path)[1].lower()
+    # If the document can be read, perform image-based checks
+    if isinstance(document, Document) or os.path.exists(document):
+        document = as_document(document)
+        file_extension = document.extension
         
         if file_extension == '.pdf':
             # For PDFs, extract images and check each one
+            owns_page_images = page_images is None
+            if owns_page_images:
+                page_images = PageImageProvider(document)
+            
             try:
-                # Convert first page to image for analysis
-                images = pdf2image.convert_from_path(file_path, first_page=1, last_page=1)
-                if images:
-                    # Save the image temporarily
-                    temp_image_path = os.path.join(tempfile.gettempdir(), "temp_pdf_image.png")
-                    images[0].save(temp_image_path)
-                    
-                    # Check signatures and image manipulation
-                    signature_alerts = check_signature_irregularities(temp_image_path)
-                    alerts.extend(signature_alerts)
-                    
-                    manipulation_alerts = detect_image_manipulation(temp_image_path)
-                    alerts.extend(manipulation_alerts)
-                    
-                    # Clean up
-                    os.remove(temp_image_path)
-                
                 # Check metadata
-                metadata_alerts = check_metadata_inconsistencies(file_path)
-                alerts.extend(metadata_alerts)
+                with stage_timer('check_metadata_inconsistencies'):
+                    metadata_alerts = check_metadata_inconsistencies(document)
+                add_alerts("metadata_inconsistency", metadata_alerts)
+                
+                # Check signatures and image manipulation on the selected pages,
+                # reusing page images and text from text extraction
+                page_count = page_images.page_count
+                page_numbers = select_forgery_pages(page_count, document.page_texts)
+                max_alerts = max(0, round(1.0 / ALERT_RISK) - len(alerts))
+                findings, pages_checked, pages_unrendered, signatures_found, requires_signatures = check_pdf_pages(
+                    page_images, page_numbers, document.page_texts, max_alerts=max_alerts, deadline=deadline,
+                    early_checks=early_checks)
+                
+                for (alert_type, description), page_regions in findings.items():
+                    add_alerts(alert_type, [_describe_pages(description, page_regions)])
+                if requires_signatures and not signatures_found:
+                    add_alerts("signature_irregularity", [MISSING_SIGNATURE_ALERT])
+                if pages_unrendered:
+                    add_alerts("analysis_incomplete", [
+                        f"{_page_list(pages_unrendered).capitalize()} could not be rendered, "
+                        f"so image checks were skipped there."
+                    ], "low")
+                pages_reached = len(pages_checked) + len(pages_unrendered)
+                if pages_reached < len(page_numbers) and len(findings) < max_alerts:
+                    add_alerts("analysis_incomplete", [
+                        f"Image checks covered {len(pages_checked)} of {len(page_numbers)} selected pages "
+                        f"within the {FORGERY_TIME_BUDGET:.0f}s time budget."
+                    ], "low")
                 
             except Exception as e:
                 logger.error(f"Error processing PDF for forgery detection: {str(e)}", exc_info=True)
-                alerts.append("Error analyzing PDF document for forgery indicators.")
+                add_alerts("analysis_error", ["Error analyzing PDF document for forgery indicators."], "low")
+            finally:
+                if owns_page_images:
+                    page_images.close()
                 
         elif file_extension in ['.jpg', '.jpeg', '.png']:
-            # For images, check directly
-            signature_alerts = check_signature_irregularities(file_path)
-            alerts.extend(signature_alerts)
+            # For images, decode once and check the same array
+            image = load_image(document)
+            if image is None:
+                logger.error(f"Failed to load image: {document.filename}")
+            
+            # Reuse the text OCR'd during extraction
+            image_text = document.page_texts[0] if document.page_texts else None
+            with stage_timer('check_signature_irregularities'):
+                signature_alerts = check_signature_irregularities(image, text=image_text)
+            add_alerts("signature_irregularity", signature_alerts)
             
-            manipulation_alerts = detect_image_manipulation(file_path)
-            alerts.extend(manipulation_alerts)
+            with stage_timer('detect_image_manipulation'):
+                manipulation_alerts = detect_image_manipulation(image)
+            add_alerts("image_manipulation", manipulation_alerts)
     
     # Calculate risk score based on number and severity of alerts
-    risk_score = min(1.0, len(alerts) * 0.2)
+    scored_alerts = [detail for detail in details if detail["type"] not in UNSCORED_ALERT_TYPES]
+    risk_score = min(1.0, len(scored_alerts) * ALERT_RISK)
     
     # Add general alert if no specific issues found but text appears suspicious
-    if not alerts and len(document_text.split()) > 100:
+    if not scored_alerts and len(document_text.split()) > 100:
         suspicious_patterns = [
             r'\bfee\s+of\s+\$\s*[\d,]+(?:\.\d+)?\s+(?:USD|dollars)\b',
             r'\bbank\s+(?:transfer|wire)\b',
@@ -345,10 +708,11 @@ def detect_forgery(document_text, file_path):
                 matches.append(pattern)
         
         if len(matches) >= 2:
-            alerts.append("Document contains potentially suspicious wording patterns. Exercise caution.")
+            add_alerts("suspicious_wording", ["Document contains potentially suspicious wording patterns. Exercise caution."])
             risk_score = max(risk_score, 0.4)
     
     return {
         "alerts": alerts,
+        "details": details,
         "risk_score": risk_score
     }
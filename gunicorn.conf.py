@@ -0,0 +1,18 @@
+# Gunicorn picks this file up automatically from the working directory
+import os
+import sys
+
+# The config is read before gunicorn puts the app directory on sys.path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from deadline import ANALYSIS_DEADLINE, BATCH_DEADLINE
+
+# Sync workers are killed after `timeout` seconds of handling one request, so it must
+# outlast the /api/analyze and /api/batch deadlines (plus time to read the uploads and
+# store the reports); otherwise a slow request ends in a dropped connection instead of
+# its error response
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', max(ANALYSIS_DEADLINE, BATCH_DEADLINE) + 30))
+
+def on_starting(server):
+    """Load the spaCy pipeline once in the master so forked workers share its memory"""
+    from document_analyzer import preload_nlp
+    preload_nlp()
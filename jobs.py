@@ -0,0 +1,169 @@
+import os
+import logging
+import threading
+import uuid
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+from models import db, Report, AnalysisJob
+from pipeline import run_analysis
+from result_cache import result_cache
+
+logger = logging.getLogger(__name__)
+
+# A job still queued or running this long after submission was lost with the process
+# that held it (a restart or crash): the pool is in memory, so nothing will resume it
+JOB_STALE_AFTER = float(os.environ.get('JOB_STALE_AFTER', 3600))
+STALE_JOB_ERROR = "Analysis was interrupted because the server restarted; please upload the document again"
+
+def get_cached_report(digest):
+    """Return the stored report for a previously analyzed document hash, or None"""
+    report_id = result_cache.get(digest)
+    if report_id is None:
+        return None
+    report = db.session.get(Report, report_id)
+    if report is None:
+        # The cached report was deleted, so the document has to be analyzed again
+        result_cache.discard(digest)
+    return report
+
+class JobQueue:
+    """Run document analysis in a background worker pool and track progress in the database"""
+
+    def __init__(self, app=None, max_workers=None):
+        self.app = None
+        self.executor = None
+        self.max_workers = max_workers
+        self.lock = threading.Lock()
+        self.queued = 0
+        self.running = 0
+        self.active = set()  # ids of jobs queued or running in this process
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Bind the queue to a Flask app and start its worker pool"""
+        self.app = app
+        max_workers = self.max_workers or app.config.get('ANALYSIS_WORKERS', os.cpu_count() or 2)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='analysis')
+        logger.info(f"Started analysis worker pool with {max_workers} workers")
+
+    def submit(self, document):
+        """Queue an in-memory Document for analysis and return the new job id"""
+        job = AnalysisJob(id=str(uuid.uuid4()), filename=document.filename, status='queued')
+        db.session.add(job)
+        db.session.commit()
+
+        with self.lock:
+            self.queued += 1
+            self.active.add(job.id)
+        self.executor.submit(self._run_job, job.id, document)
+        logger.info(f"Queued analysis job {job.id} for {document.filename}")
+        return job.id
+
+    def _run_job(self, job_id, document):
+        """Run the analysis pipeline for a job inside the worker pool"""
+        with self.lock:
+            self.queued -= 1
+            self.running += 1
+        try:
+            self._process_job(job_id, document)
+        finally:
+            with self.lock:
+                self.running -= 1
+                self.active.discard(job_id)
+
+    def _process_job(self, job_id, document):
+        with self.app.app_context():
+            job = db.session.get(AnalysisJob, job_id)
+            job.status = 'running'
+            db.session.commit()
+
+            new_digest = None
+            try:
+                # Serve repeat uploads of the same bytes from the result cache
+                digest = document.digest
+                cached_report = get_cached_report(digest)
+
+                if cached_report is not None:
+                    job.report_id = cached_report.id
+                    job.status = 'finished'
+                    logger.info(f"Job {job_id} served from result cache, report ID: {cached_report.id}")
+                else:
+                    report_data = run_analysis(document)
+
+                    new_report = Report.from_dict(report_data)
+                    db.session.add(new_report)
+                    db.session.flush()
+
+                    job.report_id = new_report.id
+                    job.status = 'finished'
+                    new_digest = digest
+                    logger.info(f"Job {job_id} finished, report saved with ID: {new_report.id}")
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Error processing job {job_id}: {str(e)}", exc_info=True)
+                job = db.session.get(AnalysisJob, job_id)
+                job.status = 'failed'
+                job.error = str(e)
+            finally:
+                job.finished_at = datetime.utcnow()
+                db.session.commit()
+
+                if new_digest is not None:
+                    result_cache.put(new_digest, job.report_id)
+
+                # Remove any copy of the document spilled to disk
+                document.close()
+
+    def is_stale(self, job):
+        """True if a queued or running job has outlived JOB_STALE_AFTER and is not being processed here"""
+        if job.status not in ('queued', 'running') or job.created_at is None:
+            return False
+        with self.lock:
+            if job.id in self.active:
+                return False
+        return datetime.utcnow() - job.created_at > timedelta(seconds=JOB_STALE_AFTER)
+
+    def fail_if_stale(self, job):
+        """Mark a job lost to a worker restart as failed, returning True if it was"""
+        if not self.is_stale(job):
+            return False
+        status = job.status
+        job.status = 'failed'
+        job.error = STALE_JOB_ERROR
+        job.finished_at = datetime.utcnow()
+        db.session.commit()
+        logger.warning(f"Job {job.id} was still {status} after {JOB_STALE_AFTER:.0f}s, marked failed")
+        return True
+
+    def fail_stale_jobs(self):
+        """
+        Mark every queued or running job older than JOB_STALE_AFTER as failed
+        Run at startup; younger jobs may belong to another web worker that is still running
+        """
+        cutoff = datetime.utcnow() - timedelta(seconds=JOB_STALE_AFTER)
+        query = AnalysisJob.query.filter(AnalysisJob.status.in_(('queued', 'running')),
+                                         AnalysisJob.created_at < cutoff)
+        with self.lock:
+            active = set(self.active)
+        if active:
+            query = query.filter(AnalysisJob.id.notin_(active))
+        count = query.update({'status': 'failed', 'error': STALE_JOB_ERROR, 'finished_at': datetime.utcnow()},
+                             synchronize_session=False)
+        db.session.commit()
+        if count:
+            logger.warning(f"Marked {count} stale analysis jobs failed")
+        return count
+
+    def depth(self):
+        """Return the number of (queued, running) jobs in this process"""
+        with self.lock:
+            return self.queued, self.running
+
+    def shutdown(self, wait=True):
+        """Stop accepting jobs and wait for running ones to complete"""
+        if self.executor is not None:
+            self.executor.shutdown(wait=wait)
+
+job_queue = JobQueue()
@@ -0,0 +1,103 @@
+import re
+from collections import deque
+
+# Text is split into alternating runs of word and non-word characters
+TOKEN_PATTERN = re.compile(r'\w+|\W+')
+
+class KeywordAutomaton:
+    """
+    Aho-Corasick automaton over word tokens for case-insensitive keyword matching
+
+    Terms and text are split into word and separator runs, so a hit always starts
+    and ends on a word boundary (the same places a \\bterm\\b regex would match),
+    and multi-word terms only match with the same separator between their words.
+    Matching costs one pass over the text however many terms there are.
+    Each of suffixes (e.g. ("s", "es") for plurals) is also accepted on a term's
+    last word; such a hit is reported as the term itself.
+    """
+
+    def __init__(self, terms, suffixes=()):
+        self.terms = []
+        self.term_token_counts = []
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]
+
+        for term in terms:
+            tokens = TOKEN_PATTERN.findall(term.strip().lower())
+            if not tokens:
+                continue
+            self._add(tokens, len(self.terms))
+            for suffix in suffixes:
+                self._add(tokens[:-1] + [tokens[-1] + suffix], len(self.terms))
+            self.terms.append(term)
+            self.term_token_counts.append(len(tokens))
+
+        self.max_tokens = max(self.term_token_counts, default=1)
+        self._build_failure_links()
+
+    def _add(self, tokens, term_index):
+        """Insert a term's token sequence into the trie"""
+        state = 0
+        for token in tokens:
+            next_state = self.goto[state].get(token)
+            if next_state is None:
+                next_state = len(self.goto)
+                self.goto[state][token] = next_state
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append([])
+            state = next_state
+        self.output[state].append(term_index)
+
+    def _build_failure_links(self):
+        """Breadth-first construction of failure links and merged outputs"""
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for token, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and token not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[next_state] = self.goto[fallback].get(token, 0)
+                self.output[next_state] = self.output[next_state] + self.output[self.fail[next_state]]
+
+    def find_all(self, text):
+        """Return every (term, start, end) hit in the text, in order of their end offsets"""
+        hits = []
+        goto, fail, output = self.goto, self.fail, self.output
+        root = goto[0]
+        token_starts = deque(maxlen=self.max_tokens)
+        state = 0
+        position = 0
+
+        # Lowercase once when that keeps offsets aligned (no character expands)
+        lowered = text.lower()
+        if len(lowered) == len(text):
+            tokens = keys = TOKEN_PATTERN.findall(lowered)
+        else:
+            tokens = TOKEN_PATTERN.findall(text)
+            keys = [token.lower() for token in tokens]
+
+        for token, key in zip(tokens, keys):
+            token_starts.append(position)
+            position += len(token)
+
+            if not state:
+                state = root.get(key, 0)
+            else:
+                while state and key not in goto[state]:
+                    state = fail[state]
+                state = goto[state].get(key, 0)
+
+            if state:
+                for term_index in output[state]:
+                    start = token_starts[-self.term_token_counts[term_index]]
+                    hits.append((self.terms[term_index], start, position))
+
+        return hits
+
+    def distinct_terms(self, text):
+        """Return the set of terms that occur at least once in the text"""
+        return {term for term, _, _ in self.find_all(text)}
@@ -0,0 +1,135 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Histogram buckets (seconds) wide enough for both regex passes and multi-page OCR
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+# Per-analysis timings collected by stage_timer, if an analysis is being timed.
+# Stages of one analysis may run in several threads, so updates take a lock
+_current_timings = ContextVar('stage_timings', default=None)
+_timings_lock = threading.Lock()
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _format_labels(pairs):
+    """Render (name, value) label pairs as {name="value",...}"""
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Histogram:
+    """Prometheus-style histogram with optional labels"""
+
+    def __init__(self, name, help_text, buckets=STAGE_BUCKETS, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self.label_names = tuple(label_names)
+        self.series = {}  # label values -> [bucket counts, sum, count]
+        self.lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        """Record one observation"""
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(label_values)
+            if series is None:
+                series = self.series[label_values] = [[0] * len(self.buckets), 0.0, 0]
+            if index < len(self.buckets):
+                series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self.lock:
+            series_items = sorted(self.series.items())
+            for label_values, (bucket_counts, total, count) in series_items:
+                pairs = list(zip(self.label_names, label_values))
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, bucket_counts):
+                    cumulative += bucket_count
+                    lines.append(f'{self.name}_bucket{_format_labels(pairs + [("le", bound)])} {cumulative}')
+                lines.append(f'{self.name}_bucket{_format_labels(pairs + [("le", "+Inf")])} {count}')
+                lines.append(f'{self.name}_sum{_format_labels(pairs)} {_format_value(total)}')
+                lines.append(f'{self.name}_count{_format_labels(pairs)} {count}')
+        return lines
+
+class Gauge:
+    """Prometheus-style gauge whose value is read from a callback at scrape time"""
+
+    def __init__(self, name, help_text, callback, metric_type='gauge'):
+        self.name = name
+        self.help_text = help_text
+        self.callback = callback
+        self.metric_type = metric_type
+
+    def render(self):
+        return [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} {self.metric_type}',
+                f'{self.name} {_format_value(self.callback())}']
+
+class Registry:
+    """Collection of metrics rendered together in the Prometheus text format"""
+
+    def __init__(self):
+        self.metrics = []
+        self.lock = threading.Lock()
+
+    def register(self, metric):
+        with self.lock:
+            self.metrics.append(metric)
+        return metric
+
+    def gauge(self, name, help_text, callback, metric_type='gauge'):
+        """Register a metric computed from a callback when scraped"""
+        return self.register(Gauge(name, help_text, callback, metric_type))
+
+    def render(self):
+        """Render every registered metric in the Prometheus text exposition format"""
+        with self.lock:
+            metrics = list(self.metrics)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+registry = Registry()
+
+stage_duration = registry.register(Histogram(
+    'legaldoc_stage_duration_seconds',
+    'Time spent in each stage of the document analysis pipeline',
+    label_names=('stage',)
+))
+
+@contextmanager
+def collect_stage_timings():
+    """Collect the stage timings recorded inside the block into a dict of stage -> seconds"""
+    timings = {}
+    token = _current_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _current_timings.reset(token)
+
+@contextmanager
+def stage_timer(stage):
+    """Time a pipeline stage, recording it in the histogram and the current analysis"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        stage_duration.observe(elapsed, stage)
+        timings = _current_timings.get()
+        if timings is not None:
+            with _timings_lock:
+                timings[stage] = timings.get(stage, 0.0) + elapsed
@@ -1,11 +1,32 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import inspect, text
+from sqlalchemy.orm import load_only
 from datetime import datetime
 import json
+import logging
+
+logger = logging.getLogger(__name__)
 
 db = SQLAlchemy()
 
+# Columns added since a table was first created; db.create_all() only creates
+# missing tables, so upgrade_schema() adds these to existing ones
+SCHEMA_COLUMNS = [
+    ('report', 'stage_timings', 'TEXT'),
+]
+
+# Indexes added to tables that already existed, created the same way
+SCHEMA_INDEXES = [
+    ('report', 'ix_report_created_at_id', ('created_at', 'id')),
+]
+
 class Report(db.Model):
     """Store document analysis reports"""
+    __table_args__ = (
+        # Serves the history listing, newest first, paged by (created_at, id)
+        db.Index('ix_report_created_at_id', 'created_at', 'id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     filename = db.Column(db.String(255), nullable=False)
     summary = db.Column(db.Text, nullable=True)
@@ -16,8 +37,11 @@ class Report(db.Model):
     scam_risk_score = db.Column(db.Float, default=0.0)
     risk_level = db.Column(db.String(20), nullable=False)
     processing_time = db.Column(db.Float, nullable=True)
+    stage_timings = db.Column(db.Text, nullable=True)  # Stored as JSON, stage name -> seconds
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    alerts = db.relationship('Alert', backref='report', cascade='all, delete-orphan')
+
     def to_dict(self):
         """Convert report to dictionary for template rendering"""
         return {
@@ -33,13 +57,40 @@ class Report(db.Model):
             },
             'risk_level': self.risk_level,
             'processing_time': str(self.processing_time),
+            'stage_timings': json.loads(self.stage_timings) if self.stage_timings else {},
             'created_at': self.created_at.strftime('%Y-%m-%d %H:%M:%S')
         }
 
+    @classmethod
+    def history_page(cls, before=None, per_page=20):
+        """
+        Return (reports, next_cursor) for one page of history, newest first
+
+        Pages are keyed on (created_at, id) so each page is an index range scan
+        however deep it is, and only the columns the listing shows are loaded.
+        before is the (created_at, id) of the last report on the previous page.
+        """
+        query = cls.query.options(load_only(cls.id, cls.filename, cls.risk_level, cls.created_at))
+        if before is not None:
+            created_at, report_id = before
+            query = query.filter(db.or_(
+                cls.created_at < created_at,
+                db.and_(cls.created_at == created_at, cls.id < report_id)
+            ))
+
+        reports = query.order_by(cls.created_at.desc(), cls.id.desc()).limit(per_page + 1).all()
+        next_cursor = None
+        if len(reports) > per_page:
+            reports = reports[:per_page]
+            next_cursor = (reports[-1].created_at, reports[-1].id)
+        return reports, next_cursor
+
     @classmethod
     def from_dict(cls, data):
-        """Create a report instance from dictionary data"""
+        """Create a report instance (and its structured alert rows) from dictionary data"""
+        created_at = datetime.utcnow()
         report = cls(
+            created_at=created_at,
             filename=data['filename'],
             summary=json.dumps(data['summary']),
             key_terms=json.dumps(data['key_terms']),
@@ -48,6 +99,128 @@ class Report(db.Model):
             forgery_risk_score=data['risk_scores']['forgery_risk'],
             scam_risk_score=data['risk_scores']['scam_risk'],
             risk_level=data['risk_level'],
-            processing_time=float(data['processing_time'])
+            processing_time=float(data['processing_time']),
+            stage_timings=json.dumps(data.get('stage_timings', {}))
+        )
+        report.alerts = [
+            Alert(
+                source=alert['source'],
+                alert_type=alert['type'],
+                risk_level=alert['risk_level'],
+                description=alert['description'],
+                context=alert.get('context'),
+                created_at=created_at
+            )
+            for alert in data.get('alert_details', [])
+        ]
+        return report
+
+class Alert(db.Model):
+    """One forgery or scam alert of a report, stored as a row so it can be filtered and aggregated"""
+    __table_args__ = (
+        # Time-window queries filtered or grouped by type, risk level or source
+        db.Index('ix_alert_type_created_at', 'alert_type', 'created_at'),
+        db.Index('ix_alert_risk_level_created_at', 'risk_level', 'created_at'),
+        db.Index('ix_alert_source_created_at', 'source', 'created_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    report_id = db.Column(db.Integer, db.ForeignKey('report.id', ondelete='CASCADE'), nullable=False, index=True)
+    source = db.Column(db.String(20), nullable=False)  # forgery, scam
+    alert_type = db.Column(db.String(64), nullable=False)
+    risk_level = db.Column(db.String(20), nullable=False)  # high, medium, low
+    description = db.Column(db.Text, nullable=False)
+    context = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)  # Copied from the report
+
+    def to_dict(self):
+        """Convert alert to dictionary for the alerts API"""
+        return {
+            'id': self.id,
+            'report_id': self.report_id,
+            'source': self.source,
+            'type': self.alert_type,
+            'risk_level': self.risk_level,
+            'description': self.description,
+            'context': self.context,
+            'created_at': self.created_at.strftime('%Y-%m-%d %H:%M:%S')
+        }
+
+    @classmethod
+    def _filtered(cls, query, since, until, source=None, alert_type=None, risk_level=None):
+        query = query.filter(cls.created_at >= since, cls.created_at < until)
+        if source:
+            query = query.filter(cls.source == source)
+        if alert_type:
+            query = query.filter(cls.alert_type == alert_type)
+        if risk_level:
+            query = query.filter(cls.risk_level == risk_level)
+        return query
+
+    @classmethod
+    def counts(cls, since, until, source=None, alert_type=None, risk_level=None):
+        """
+        Count alerts and affected reports per (source, type, risk level) in a time
+        window, grouped inside the database
+        """
+        query = db.session.query(
+            cls.source, cls.alert_type, cls.risk_level,
+            db.func.count(cls.id), db.func.count(db.distinct(cls.report_id))
         )
-        return report
\ No newline at end of file
+        query = cls._filtered(query, since, until, source, alert_type, risk_level)
+        rows = query.group_by(cls.source, cls.alert_type, cls.risk_level) \
+                    .order_by(db.func.count(cls.id).desc()).all()
+        return [
+            {'source': source, 'type': alert_type, 'risk_level': risk_level, 'count': count, 'reports': reports}
+            for source, alert_type, risk_level, count, reports in rows
+        ]
+
+    @classmethod
+    def search(cls, since, until, source=None, alert_type=None, risk_level=None, limit=100):
+        """Return (alert, report filename) pairs matching the filters, newest first"""
+        query = db.session.query(cls, Report.filename).join(Report, cls.report_id == Report.id)
+        query = cls._filtered(query, since, until, source, alert_type, risk_level)
+        return query.order_by(cls.created_at.desc(), cls.id.desc()).limit(limit).all()
+
+class AnalysisJob(db.Model):
+    """Track a queued document analysis run by the background worker pool"""
+    id = db.Column(db.String(36), primary_key=True)
+    filename = db.Column(db.String(255), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, finished, failed
+    report_id = db.Column(db.Integer, db.ForeignKey('report.id', ondelete='SET NULL'), nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    def to_dict(self):
+        """Convert job to dictionary for the status endpoint"""
+        return {
+            'id': self.id,
+            'filename': self.filename,
+            'status': self.status,
+            'report_id': self.report_id,
+            'error': self.error,
+            'created_at': self.created_at.strftime('%Y-%m-%d %H:%M:%S') if self.created_at else None,
+            'finished_at': self.finished_at.strftime('%Y-%m-%d %H:%M:%S') if self.finished_at else None
+        }
+
+def upgrade_schema():
+    """
+    Add columns and indexes missing from tables created by older versions
+    Safe to run on every start, including from several workers at once
+    """
+    inspector = inspect(db.engine)
+    with db.engine.begin() as connection:
+        for table, column, column_type in SCHEMA_COLUMNS:
+            if column in {existing['name'] for existing in inspector.get_columns(table)}:
+                continue
+            if connection.dialect.name == 'postgresql':
+                connection.execute(text(f'ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {column} {column_type}'))
+            else:
+                connection.execute(text(f'ALTER TABLE {table} ADD COLUMN {column} {column_type}'))
+            logger.info(f"Added column {table}.{column}")
+        for table, name, columns in SCHEMA_INDEXES:
+            if name in {existing['name'] for existing in inspector.get_indexes(table)}:
+                continue
+            connection.execute(text(f'CREATE INDEX IF NOT EXISTS {name} ON {table} ({", ".join(columns)})'))
+            logger.info(f"Added index {name}")
@@ -0,0 +1,104 @@
+import os
+import logging
+import hashlib
+import threading
+from collections import OrderedDict
+
+from ocr_engine import ocr_engine, as_pil_image
+
+logger = logging.getLogger(__name__)
+
+class OcrCache:
+    """
+    LRU cache of OCR text keyed by a hash of the image contents, bounded by the
+    total size of the cached text, so repeated pages (boilerplate terms, the
+    same scan uploaded twice) are only OCR'd once
+    """
+
+    def __init__(self, max_bytes=32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # image key -> text
+        self.size = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Return the cached text for an image key, or None on a miss"""
+        with self.lock:
+            text = self.entries.get(key)
+            if text is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return text
+
+    def put(self, key, text):
+        """Store the text for an image key, evicting the least recently used entries if full"""
+        text_size = len(text.encode('utf-8'))
+        if text_size > self.max_bytes:
+            return
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous.encode('utf-8'))
+            self.entries[key] = text
+            self.size += text_size
+            while self.size > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted.encode('utf-8'))
+                self.evictions += 1
+
+    def clear(self):
+        """Drop every cached text"""
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def stats(self):
+        """Return hit/miss counters for monitoring"""
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'bytes': self.size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
+
+ocr_cache = OcrCache(max_bytes=int(os.environ.get('OCR_CACHE_MAX_BYTES', 32 * 1024 * 1024)))
+
+def image_key(image, engine=ocr_engine):
+    """Hash of an image's pixels and the OCR settings that affect its text"""
+    image = as_pil_image(image)
+    sha256 = hashlib.sha256(f"{engine.lang}:{engine.psm}:{image.mode}:{image.size}:".encode())
+    sha256.update(image.tobytes())
+    return sha256.hexdigest()
+
+def ocr_images(images, engine=ocr_engine, deadline=None):
+    """OCR images through the cache, running tesseract once for each distinct uncached image"""
+    keys = [image_key(image, engine) for image in images]
+    texts = {}
+    missing = {}  # key -> image, so identical images in one call are OCR'd once
+    for key, image in zip(keys, images):
+        if key in texts or key in missing:
+            continue
+        text = ocr_cache.get(key)
+        if text is None:
+            missing[key] = image
+        else:
+            texts[key] = text
+
+    if missing:
+        for key, text in zip(missing, engine.images_to_strings(list(missing.values()), deadline)):
+            ocr_cache.put(key, text)
+            texts[key] = text
+    return [texts[key] for key in keys]
+
+def ocr_image(image, engine=ocr_engine, deadline=None):
+    """OCR one image through the cache"""
+    return ocr_images([image], engine, deadline)[0]
@@ -0,0 +1,103 @@
+import os
+import logging
+import tempfile
+import subprocess
+import numpy as np
+import pytesseract
+from PIL import Image
+
+from deadline import AnalysisDeadlineExceeded, check_deadline, time_left
+
+logger = logging.getLogger(__name__)
+
+# Tesseract settings shared by every OCR call
+OCR_LANG = os.environ.get('OCR_LANG', 'eng')
+OCR_PSM = int(os.environ.get('OCR_PSM', 3))
+# OpenMP threads per tesseract process; pages are already OCR'd in parallel processes
+OCR_THREADS = int(os.environ.get('OCR_THREADS', 1))
+# Pages handed to a single tesseract run, so its start-up and language data load are shared
+OCR_BATCH_SIZE = int(os.environ.get('OCR_BATCH_SIZE', 4))
+
+# Tesseract writes this between the pages of a multi-image run
+PAGE_SEPARATOR = '\f'
+
+class TesseractEngine:
+    """
+    OCR through the tesseract command line, many images per process
+
+    Each run is given a list file of images and prints the text of all of them
+    to stdout, so tesseract starts and loads its language data once per batch
+    rather than once per page.
+    """
+
+    def __init__(self, lang=OCR_LANG, psm=OCR_PSM, threads=OCR_THREADS, batch_size=OCR_BATCH_SIZE,
+                 tesseract_cmd=None):
+        self.lang = lang
+        self.psm = psm
+        self.threads = threads
+        self.batch_size = max(1, batch_size)
+        self.tesseract_cmd = tesseract_cmd
+
+    def image_to_string(self, image, deadline=None):
+        """OCR one image (PIL image or array) and return its text"""
+        return self.images_to_strings([image], deadline)[0]
+
+    def images_to_strings(self, images, deadline=None):
+        """
+        OCR images in batches of batch_size and return their texts in order
+        A tesseract run still going at the deadline (a time.monotonic() value) is killed
+        """
+        texts = []
+        for start in range(0, len(images), self.batch_size):
+            check_deadline(deadline, "Analysis deadline passed during OCR")
+            texts.extend(self._run(images[start:start + self.batch_size], deadline))
+        return texts
+
+    def _run(self, images, deadline=None):
+        """One tesseract process over a batch of images"""
+        if not images:
+            return []
+
+        with tempfile.TemporaryDirectory(prefix='ocr_') as work_dir:
+            image_paths = []
+            for index, image in enumerate(images):
+                image_path = os.path.join(work_dir, f'{index}.png')
+                # Fast, lightly compressed PNGs: the files only live for this run
+                as_pil_image(image).save(image_path, compress_level=1)
+                image_paths.append(image_path)
+
+            list_path = os.path.join(work_dir, 'images.txt')
+            with open(list_path, 'w') as f:
+                f.write('\n'.join(image_paths) + '\n')
+
+            command = [self.tesseract_cmd or pytesseract.pytesseract.tesseract_cmd,
+                       list_path, 'stdout', '-l', self.lang, '--psm', str(self.psm)]
+            env = dict(os.environ, OMP_THREAD_LIMIT=str(self.threads))
+            try:
+                result = subprocess.run(command, capture_output=True, env=env, timeout=time_left(deadline))
+            except FileNotFoundError:
+                raise pytesseract.TesseractNotFoundError()
+            except subprocess.TimeoutExpired:
+                raise AnalysisDeadlineExceeded("Analysis deadline passed during OCR")
+
+        if result.returncode != 0:
+            raise pytesseract.TesseractError(result.returncode, result.stderr.decode('utf-8', errors='replace'))
+
+        texts = result.stdout.decode('utf-8', errors='replace').split(PAGE_SEPARATOR)
+        # Tesseract ends each page with the separator, leaving an empty tail
+        if len(texts) == len(images) + 1 and not texts[-1].strip():
+            texts.pop()
+        if len(texts) != len(images):
+            raise pytesseract.TesseractError(
+                result.returncode, f"Expected text for {len(images)} images, got {len(texts)} pages")
+        return texts
+
+def as_pil_image(image):
+    """PIL image for a PIL image or an OpenCV (BGR or grayscale) array"""
+    if isinstance(image, np.ndarray):
+        if image.ndim == 3 and image.shape[2] == 3:
+            image = image[:, :, ::-1]
+        return Image.fromarray(np.ascontiguousarray(image))
+    return image
+
+ocr_engine = TesseractEngine()
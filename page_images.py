@@ -0,0 +1,116 @@
+import os
+import logging
+import threading
+import pdf2image
+
+from document import Document, as_document
+from metrics import stage_timer
+
+logger = logging.getLogger(__name__)
+
+# Resolution used to rasterize PDF pages for OCR and image forensics
+PAGE_IMAGE_DPI = int(os.environ.get('PAGE_IMAGE_DPI', 200))
+PAGE_RENDER_THREADS = int(os.environ.get('PAGE_RENDER_THREADS', os.cpu_count() or 1))
+
+class PageImageProvider:
+    """
+    Render the pages of one PDF on demand and share the in-memory images
+    between text extraction and forgery checks during a request. Stages
+    release pages as they finish with them, so only the pages being worked
+    on are held; a released page is rendered again if it is asked for.
+    A release_hook may take over a released page's image (and close it once done
+    with it), so a later stage can use the page without rendering it again.
+    Accepts a Document or a file path; poppler reads the document's spilled copy
+    """
+
+    def __init__(self, document, dpi=PAGE_IMAGE_DPI):
+        self.owns_document = not isinstance(document, Document)
+        self.document = as_document(document)
+        self.dpi = dpi
+        self.pages = {}  # 1-based page number -> PIL image
+        self.lock = threading.Lock()
+        self.closed = False
+        self.release_hook = None  # callable(page_number, image, text) that must close the image
+        self._page_count = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def page_count(self):
+        """Number of pages in the PDF according to poppler"""
+        if self._page_count is None:
+            self._page_count = pdf2image.pdfinfo_from_path(self.document.path)["Pages"]
+        return self._page_count
+
+    def render(self, page_numbers):
+        """Rasterize any of the given pages that have not been rendered yet"""
+        with self.lock:
+            if self.closed:
+                raise ValueError(f"Page images of {self.document.filename} were already released")
+            missing = sorted(set(page_numbers) - set(self.pages))
+            if not missing:
+                return
+
+            # Render each contiguous run of pages with a single poppler invocation
+            runs = []
+            for page_number in missing:
+                if runs and page_number == runs[-1][1] + 1:
+                    runs[-1][1] = page_number
+                else:
+                    runs.append([page_number, page_number])
+
+            for first_page, last_page in runs:
+                logger.debug(f"Rendering pages {first_page}-{last_page} of {self.document.filename} at {self.dpi} DPI")
+                with stage_timer('render_pages'):
+                    images = pdf2image.convert_from_path(
+                        self.document.path,
+                        dpi=self.dpi,
+                        first_page=first_page,
+                        last_page=last_page,
+                        thread_count=min(PAGE_RENDER_THREADS, last_page - first_page + 1)
+                    )
+                for offset, image in enumerate(images):
+                    self.pages[first_page + offset] = image
+
+                # Remember pages poppler could not render so they are not retried
+                for page_number in range(first_page + len(images), last_page + 1):
+                    self.pages[page_number] = None
+
+    def get_page(self, page_number):
+        """Return the rendered image for a 1-based page number, or None if it has none"""
+        self.render([page_number])
+        return self.pages.get(page_number)
+
+    def release(self, page_numbers, texts=None):
+        """
+        Free the images of pages a stage has finished with; they are re-rendered if asked for again
+        texts, if given, holds each page's text for the release hook
+        """
+        released = []
+        with self.lock:
+            for index, page_number in enumerate(page_numbers):
+                # Pages poppler could not render stay marked so they are not retried
+                if self.pages.get(page_number) is not None:
+                    released.append((page_number, self.pages.pop(page_number), texts[index] if texts else None))
+
+        # Outside the lock: the hook may wait for room to take the page
+        for page_number, image, text in released:
+            if self.release_hook is not None:
+                self.release_hook(page_number, image, text)
+            else:
+                image.close()
+
+    def close(self):
+        """Release the rendered page images"""
+        with self.lock:
+            self.closed = True
+            for image in self.pages.values():
+                if image is not None:
+                    image.close()
+            self.pages.clear()
+        if self.owns_document:
+            self.document.close()
@@ -0,0 +1,175 @@
+import os
+import logging
+import threading
+import time
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_EXCEPTION
+
+# Import document processing modules
+from text_extractor import extract_text_from_document
+from document_analyzer import analyze_document, analyze_documents
+from forgery_detector import detect_forgery, EarlyPageChecks
+from scam_detector import detect_scams
+from page_images import PageImageProvider
+from document import as_document
+from metrics import collect_stage_timings, stage_timer
+from deadline import AnalysisDeadlineExceeded, ANALYSIS_DEADLINE, check_deadline, time_left
+
+logger = logging.getLogger(__name__)
+
+# The text, forgery and scam stages run concurrently after extraction and must
+# all finish within ANALYSIS_DEADLINE seconds of the analysis starting
+PARALLEL_STAGES = os.environ.get('PARALLEL_STAGES', '1') != '0'
+STAGE_WORKERS = int(os.environ.get('STAGE_WORKERS', 3 * (os.cpu_count() or 2)))
+
+_stage_executor = None
+_stage_executor_lock = threading.Lock()
+
+class NoTextExtractedError(ValueError):
+    """Raised when no text could be extracted from an uploaded document"""
+    pass
+
+def _get_stage_executor():
+    """Thread pool shared by the concurrent analysis stages, started on first use"""
+    global _stage_executor
+    with _stage_executor_lock:
+        if _stage_executor is None:
+            _stage_executor = ThreadPoolExecutor(max_workers=STAGE_WORKERS, thread_name_prefix='stage')
+        return _stage_executor
+
+def run_stages(stages, deadline):
+    """
+    Run independent stages and return their results by name
+
+    stages maps a stage name to (function, args). Stages run concurrently (each
+    timed under its name) unless PARALLEL_STAGES is off; the first failure is
+    re-raised, and AnalysisDeadlineExceeded is raised if they are still running
+    at the deadline (a time.monotonic() value). Running stages cannot be
+    cancelled, so stages that may run long take the deadline themselves and stop.
+    """
+    def run_stage(name, function, args):
+        with stage_timer(name):
+            return function(*args)
+
+    if not PARALLEL_STAGES:
+        results = {}
+        for name, (function, args) in stages.items():
+            check_deadline(deadline, f"Analysis did not finish within {ANALYSIS_DEADLINE:.0f} seconds (reached {name})")
+            results[name] = run_stage(name, function, args)
+        return results
+
+    # Nothing is started once the budget is spent (e.g. by a long extraction)
+    check_deadline(deadline, f"Analysis did not finish within {ANALYSIS_DEADLINE:.0f} seconds (text extraction)")
+    executor = _get_stage_executor()
+    # Each stage runs in a copy of this context so its timings reach the current analysis
+    futures = {
+        executor.submit(contextvars.copy_context().run, run_stage, name, function, args): name
+        for name, (function, args) in stages.items()
+    }
+    done, not_done = wait(futures, timeout=time_left(deadline), return_when=FIRST_EXCEPTION)
+
+    for future in done:
+        if future.exception() is not None:
+            for pending in not_done:
+                pending.cancel()
+            raise future.exception()
+
+    if not_done:
+        for pending in not_done:
+            pending.cancel()
+        late = ', '.join(sorted(futures[future] for future in not_done))
+        raise AnalysisDeadlineExceeded(f"Analysis did not finish within {ANALYSIS_DEADLINE:.0f} seconds ({late} still running)")
+
+    return {futures[future]: future.result() for future in done}
+
+def calculate_risk_level(risk_scores):
+    """Map the combined risk score onto a Low/Medium/High level"""
+    combined_risk_score = max(risk_scores.values())
+    return "Low" if combined_risk_score < 0.4 else "Medium" if combined_risk_score < 0.7 else "High"
+
+def run_analysis(document, deadline=None, analyze_text=True):
+    """
+    Run the full analysis pipeline on a Document (or file path) and return the report data
+    The analysis stops after ANALYSIS_DEADLINE seconds, or at an earlier deadline
+    (a time.monotonic() value) such as the end of a batch's time. With analyze_text
+    off the text analysis is left out and the extracted text is returned under
+    'document_text', for analyze_texts() to analyze with other documents' text
+    """
+    document = as_document(document)
+    with collect_stage_timings() as stage_timings, stage_timer('total'):
+        own_deadline = time.monotonic() + ANALYSIS_DEADLINE
+        deadline = own_deadline if deadline is None else min(deadline, own_deadline)
+        # Render each PDF page at most once and share the images between stages
+        if document.extension == '.pdf':
+            with PageImageProvider(document) as page_images:
+                # Pages OCR releases go straight to their forgery checks
+                early_checks = EarlyPageChecks(page_images, deadline=deadline)
+                try:
+                    report_data = _run_analysis(document, deadline, page_images, early_checks, analyze_text)
+                finally:
+                    early_checks.cancel()
+        else:
+            report_data = _run_analysis(document, deadline, analyze_text=analyze_text)
+
+    report_data["stage_timings"] = {stage: round(seconds, 4) for stage, seconds in stage_timings.items()}
+    return report_data
+
+def analyze_texts(reports_data):
+    """
+    Fill in the summary and key terms of reports made with analyze_text off,
+    running all their texts through one batched nlp.pipe pass
+    """
+    with stage_timer('analyze_documents'):
+        analysis_results = analyze_documents([report_data.pop('document_text') for report_data in reports_data])
+    for report_data, results in zip(reports_data, analysis_results):
+        report_data["summary"] = results['summary']
+        report_data["key_terms"] = results['key_terms']
+    return reports_data
+
+def _run_analysis(document, deadline, page_images=None, early_checks=None, analyze_text=True):
+    start_time = time.time()
+
+    # Extract text from the document
+    logger.info("Extracting text...")
+    with stage_timer('extract_text_from_document'):
+        document_text = extract_text_from_document(document, page_images, deadline)
+
+    if not document_text or document_text.strip() == "":
+        raise NoTextExtractedError("Could not extract text from document. Please check the file and try again.")
+
+    # Analyze the text and check for forgery and scams; none depends on another
+    logger.info("Analyzing document and checking for forgery and scams...")
+    stages = {'analyze_document': (analyze_document, (document_text,))} if analyze_text else {}
+    stages['detect_forgery'] = (detect_forgery, (document_text, document, page_images, deadline, early_checks))
+    stages['detect_scams'] = (detect_scams, (document_text,))
+    results = run_stages(stages, deadline)
+    analysis_results = results.get('analyze_document', {})
+    forgery_results = results['detect_forgery']
+    scam_results = results['detect_scams']
+
+    # Calculate overall risk score based on forgery and scam results
+    risk_scores = {
+        "forgery_risk": forgery_results['risk_score'],
+        "scam_risk": scam_results['risk_score'],
+    }
+
+    report_data = {
+        "filename": document.filename,
+        "summary": analysis_results.get('summary'),
+        "key_terms": analysis_results.get('key_terms'),
+        "forgery_alerts": forgery_results['alerts'],
+        "scam_alerts": scam_results['alerts'],
+        "alert_details": (
+            [dict(alert, source="forgery") for alert in forgery_results['details']] +
+            [dict(alert, source="scam") for alert in scam_results['details']]
+        ),
+        "risk_scores": risk_scores,
+        "risk_level": calculate_risk_level(risk_scores),
+        "processing_time": f"{time.time() - start_time:.2f}"
+    }
+
+    if not analyze_text:
+        report_data["document_text"] = document_text
+
+    logger.info("Document analysis complete")
+    return report_data
@@ -0,0 +1,87 @@
+import os
+import logging
+import threading
+from collections import OrderedDict
+
+from models import db, Report
+
+logger = logging.getLogger(__name__)
+
+class ReportCache:
+    """
+    In-process LRU cache of rendered report dicts keyed by report id, so repeat
+    views skip loading the row and decoding its JSON. Cached dicts are shared
+    between requests and must be treated as read-only.
+
+    Each web worker has its own cache and invalidate() only reaches the one that
+    handled the delete, so get_report_data() still checks a cached report exists.
+    """
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # report id -> report dict
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, report_id):
+        """Return the cached dict for a report id, or None on a miss"""
+        with self.lock:
+            report_data = self.entries.get(report_id)
+            if report_data is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(report_id)
+            self.hits += 1
+            return report_data
+
+    def put(self, report_id, report_data):
+        """Store a report dict, evicting the least recently used entries if full"""
+        with self.lock:
+            self.entries[report_id] = report_data
+            self.entries.move_to_end(report_id)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, report_id):
+        """Drop a report, e.g. after it is deleted"""
+        with self.lock:
+            self.entries.pop(report_id, None)
+
+    def stats(self):
+        """Return hit/miss counters for monitoring"""
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
+
+report_cache = ReportCache(max_entries=int(os.environ.get('REPORT_CACHE_SIZE', 256)))
+
+def get_report_data(report_id):
+    """Return the ready-to-render dict for a report, from the cache or the database, or None"""
+    report_data = report_cache.get(report_id)
+    if report_data is not None:
+        # Reports are never edited, only deleted, possibly through another worker
+        if db.session.query(Report.id).filter_by(id=report_id).first() is None:
+            report_cache.invalidate(report_id)
+            return None
+    else:
+        report_obj = db.session.get(Report, report_id)
+        if report_obj is None:
+            return None
+        report_data = report_obj.to_dict()
+        report_cache.put(report_id, report_data)
+    return report_data
+
+def cache_report(report_obj):
+    """Render a freshly saved report once and cache the result"""
+    report_data = report_obj.to_dict()
+    report_cache.put(report_obj.id, report_data)
+    return report_data
@@ -0,0 +1,83 @@
+import os
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever extraction or detection rules change so stale results are not served
+ANALYSIS_VERSION = "1"
+
+class ResultCache:
+    """Content-addressed cache mapping document hashes to finished report ids"""
+
+    def __init__(self, max_entries=1024, max_age=24 * 60 * 60, version=ANALYSIS_VERSION):
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.version = version
+        self.entries = OrderedDict()  # (digest, version) -> (report_id, stored_at)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _key(self, digest):
+        return (digest, self.version)
+
+    def get(self, digest):
+        """Return the cached report id for a document hash, or None on a miss"""
+        key = self._key(digest)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and time.time() - entry[1] > self.max_age:
+                del self.entries[key]
+                self.evictions += 1
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, digest, report_id):
+        """Store the report id for a document hash, evicting the oldest entries if full"""
+        key = self._key(digest)
+        with self.lock:
+            self.entries[key] = (report_id, time.time())
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def discard(self, digest):
+        """Drop a single document hash from the cache"""
+        with self.lock:
+            self.entries.pop(self._key(digest), None)
+
+    def invalidate_report(self, report_id):
+        """Drop every entry that points at a report, e.g. after it is deleted"""
+        with self.lock:
+            stale = [key for key, (cached_id, _) in self.entries.items() if cached_id == report_id]
+            for key in stale:
+                del self.entries[key]
+
+    def stats(self):
+        """Return hit/miss counters for monitoring"""
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
+
+result_cache = ResultCache(
+    max_entries=int(os.environ.get('RESULT_CACHE_SIZE', 1024)),
+    max_age=int(os.environ.get('RESULT_CACHE_TTL', 24 * 60 * 60))
+)
@@ -3,6 +3,16 @@ import re
 import os
 from collections import Counter
 
+from text_index import SentenceIndex
+from keyword_matcher import KeywordAutomaton
+from metrics import stage_timer
+
+try:
+    from re import _parser as sre_parse, _constants as sre_constants
+except ImportError:  # Python < 3.11
+    import sre_parse
+    import sre_constants
+
 # Setup logging
 logger = logging.getLogger(__name__)
 
@@ -120,41 +130,217 @@ KNOWN_SCAM_KEYWORDS = [
     "bitcoin", "gift card", "overseas bank", "foreign investor"
 ]
 
-def detect_suspicious_clauses(text):
+# Scam keywords matched on word boundaries in a single pass; plurals ("gift cards",
+# "wire transfers") count as the keyword itself
+SCAM_KEYWORD_MATCHER = KeywordAutomaton(KNOWN_SCAM_KEYWORDS, suffixes=("s", "es"))
+
+# Company names, used to spot documents that mix several entities
+COMPANY_NAME_PATTERN = re.compile(r'\b(?:[A-Z][a-z]*\s+)+(?:LLC|Inc|Ltd|Corporation|Corp|Company|Co|GmbH|SA|NV|PLC)\b')
+
+# Language structures common in scam communications
+SCAM_STRUCTURES = [
+    (r"\b(?:dear|attention|greetings)(?:\s+to)?\s+(?:sir|madam|friend|beneficiary)", "Starts with generic greeting common in scam communications"),
+    (r"\bI\s+(?:am|represent)\s+(?:a|the)\s+(?:bank|attorney|solicitor|barrister)", "Claims to be a financial or legal representative, common in scams"),
+    (r"\b(?:million|billion)\s+(?:dollars|USD|euros|pounds)", "References unusually large sums of money"),
+    (r"\b(?:confidential|private|sensitive)\s+(?:business|transaction|matter|proposal)", "Emphasizes secrecy for a business proposal"),
+    (r"\b(?:next\s+of\s+kin|beneficiary|heir)\s+to\s+(?:the|a)\s+(?:late|deceased)", "Inheritance scam pattern"),
+    (r"\bcontact\s+(?:me|us)\s+(?:(?:as\s+)?soon\s+as\s+possible|immediately|urgently)", "Urges immediate contact"),
+    (r"\b(?:percentage|share|commission)\s+of\s+(?:the|this)\s+(?:fund|money|amount)", "Offers a percentage of funds"),
+    (r"\b(?:God|Allah|heaven)\s+bless\s+(?:you|your|family)", "Religious blessing, common in certain scams")
+]
+
+# Requests that might indicate fraud
+UNUSUAL_REQUESTS = [
+    (r"\b(?:transfer|send|wire|deposit)\s+(?:money|funds|payment|fee)\s+(?:to|into)\s+(?:my|our|the)\s+(?:account|bank)", 
+     "Requests money transfer to an account"),
+    
+    (r"\b(?:prepay|advance|upfront)\s+(?:fee|payment|deposit|money)\s+(?:of|for|to)\s+", 
+     "Requests advance payment or fee"),
+    
+    (r"\b(?:gift\s+cards?|itunes|amazon|google\s+play|steam)\s+(?:cards?|codes?|vouchers?)", 
+     "Requests payment in gift cards, a common scam tactic"),
+    
+    (r"\bcryptocurrency\s+(?:payment|transfer|wallet|address|bitcoin|ethereum|crypto)", 
+     "Requests cryptocurrency payment, often used in scams due to irreversibility"),
+    
+    (r"\b(?:sensitive|confidential|personal)\s+(?:information|details|data)\s+(?:such\s+as|including|like)\s+(?:passport|driver's\s+license|id|birth\s+certificate)", 
+     "Requests excessive personal identification documents"),
+    
+    (r"\bverification\s+(?:code|number|pin)\s+(?:sent|received|texted|messaged)\s+to\s+(?:your|the)\s+(?:phone|mobile|cell)", 
+     "Requests verification codes sent to your phone, common in identity theft"),
+    
+    (r"\bdo\s+not\s+(?:tell|inform|share|discuss)\s+(?:with|this|anyone|anybody|lawyers|attorneys|accountants)", 
+     "Requests secrecy or non-disclosure to professional advisors")
+]
+
+# Pairs of statements that contradict each other
+CONFLICTING_TERMS = [
+    (r"\bno\s+(?:fee|cost|charge)\b", r"\b(?:pay|payment|fee|cost|charge)\s+of\s+[\$\€\£]?\s*\d+", 
+     "Document claims no fees but then mentions payments/charges"),
+    
+    (r"\bfree\b", r"\bcosts?\s+[\$\€\£]?\s*\d+", 
+     "Document claims to be free but then mentions costs"),
+    
+    (r"\bno\s+obligation\b", r"\bmust\s+(?:pay|provide|submit|agree)", 
+     "Document claims no obligation but then imposes requirements"),
+    
+    (r"\bguaranteed\b", r"\bno\s+(?:guarantee|warranty|assurance)", 
+     "Document provides conflicting statements about guarantees")
+]
+
+# Upper bound on trigger prefixes derived from a single rule
+MAX_RULE_PREFIXES = 64
+
+def _literal_prefixes(parsed):
+    """
+    Return the literal strings a match of a parsed pattern must start with, and
+    whether the whole pattern was consumed while collecting them
+    """
+    prefixes = {""}
+    for op, av in parsed:
+        if op is sre_constants.AT:
+            continue
+        if op is sre_constants.LITERAL:
+            prefixes = {prefix + chr(av) for prefix in prefixes}
+            continue
+        if op is sre_constants.SUBPATTERN:
+            branches = [av[3]]
+        elif op is sre_constants.BRANCH:
+            branches = av[1]
+        else:
+            return prefixes, False
+
+        alternatives = set()
+        complete = True
+        for branch in branches:
+            branch_prefixes, branch_complete = _literal_prefixes(branch)
+            if "" in branch_prefixes:
+                return prefixes, False
+            alternatives |= branch_prefixes
+            complete = complete and branch_complete
+        if len(prefixes) * len(alternatives) > MAX_RULE_PREFIXES:
+            return prefixes, False
+        prefixes = {prefix + alternative for prefix in prefixes for alternative in alternatives}
+        if not complete:
+            return prefixes, False
+    return prefixes, True
+
+class RuleMatcher:
+    """
+    Match a table of regex rules against a text in one scan
+
+    Each rule is reduced to the literal words its matches must start with. A
+    single trigger regex finds every position where any of those words begins,
+    and only the rules that can start with that character are tried there.
+    first_hits() returns the span of the first match of each rule, the same span
+    a separate re.search() for that rule would report.
+    """
+
+    def __init__(self, rules, flags=re.IGNORECASE):
+        self.rule_ids = [rule_id for rule_id, _ in rules]
+        self.patterns = [re.compile(pattern, flags) for _, pattern in rules]
+        self.rules_by_char = {}
+        self.untriggered = []  # rules without a literal prefix, searched on their own
+
+        boundary_prefixes = set()
+        other_prefixes = set()
+        for index, (_, pattern) in enumerate(rules):
+            parsed = list(sre_parse.parse(pattern, flags))
+            prefixes, _ = _literal_prefixes(parsed)
+            if "" in prefixes:
+                self.untriggered.append(index)
+                continue
+
+            starts_at_boundary = bool(parsed) and parsed[0] == (sre_constants.AT, sre_constants.AT_BOUNDARY)
+            (boundary_prefixes if starts_at_boundary else other_prefixes).update(prefixes)
+            for prefix in prefixes:
+                self.rules_by_char.setdefault(prefix[0].lower(), []).append(index)
+
+        for char, indexes in self.rules_by_char.items():
+            self.rules_by_char[char] = sorted(set(indexes))
+        self.triggered = sorted(set(range(len(rules))) - set(self.untriggered))
+
+        def alternation(prefixes):
+            # Longest first so shared stems do not shadow longer words
+            return "|".join(re.escape(prefix) for prefix in sorted(prefixes, key=lambda p: (-len(p), p)))
+
+        trigger_parts = []
+        if boundary_prefixes:
+            trigger_parts.append(r"\b(?:" + alternation(boundary_prefixes) + ")")
+        if other_prefixes:
+            trigger_parts.append("(?:" + alternation(other_prefixes) + ")")
+        self.trigger = re.compile("(?=" + "|".join(trigger_parts) + ")", flags) if trigger_parts else None
+
+    def first_hits(self, text):
+        """Return a dict mapping each matching rule id to the (start, end) span of its first match"""
+        hits = {}
+        for index in self.untriggered:
+            match_obj = self.patterns[index].search(text)
+            if match_obj:
+                hits[self.rule_ids[index]] = match_obj.span()
+
+        if self.trigger is None:
+            return hits
+
+        for trigger_match in self.trigger.finditer(text):
+            position = trigger_match.start()
+            # Characters outside the ASCII table may case-fold onto any rule, so try them all
+            candidates = self.rules_by_char.get(text[position].lower(), self.triggered)
+            for index in candidates:
+                rule_id = self.rule_ids[index]
+                if rule_id in hits:
+                    continue
+                match_obj = self.patterns[index].match(text, position)
+                if match_obj:
+                    hits[rule_id] = match_obj.span()
+
+            if len(hits) == len(self.rule_ids):
+                break
+        return hits
+
+def _build_scam_rules():
+    """Collect every regex rule table into (rule id, pattern) pairs"""
+    rules = []
+    for clause_type, clause_info in SUSPICIOUS_CLAUSES.items():
+        for index, pattern in enumerate(clause_info["patterns"]):
+            rules.append((f"{clause_type}:{index}", pattern))
+    for index, (pattern, _) in enumerate(SCAM_STRUCTURES):
+        rules.append((f"scam_structure:{index}", pattern))
+    for index, (pattern, _) in enumerate(UNUSUAL_REQUESTS):
+        rules.append((f"unusual_request:{index}", pattern))
+    for index, (pattern1, pattern2, _) in enumerate(CONFLICTING_TERMS):
+        rules.append((f"inconsistency:{index}:first", pattern1))
+        rules.append((f"inconsistency:{index}:second", pattern2))
+    return rules
+
+# All rule tables compiled once at import
+SCAM_RULES = RuleMatcher(_build_scam_rules())
+
+def detect_suspicious_clauses(text, hits=None, sentences=None):
     """Detect suspicious clauses in the document text"""
+    if hits is None:
+        hits = SCAM_RULES.first_hits(text)
+    if sentences is None:
+        sentences = SentenceIndex(text)
     found_clauses = []
     
     # Check for each suspicious clause type
     for clause_type, clause_info in SUSPICIOUS_CLAUSES.items():
-        for pattern in clause_info["patterns"]:
-            matches = re.findall(pattern, text, re.IGNORECASE)
-            if matches:
-                # For each match, extract the surrounding context
-                for match in matches:
-                    # Find the start of the sentence containing the match
-                    pattern_obj = re.compile(pattern, re.IGNORECASE)
-                    for match_obj in pattern_obj.finditer(text):
-                        start_pos = max(0, text[:match_obj.start()].rfind('.') + 1)
-                        if start_pos == 0:
-                            start_pos = max(0, text[:match_obj.start()].rfind('\n') + 1)
-                        
-                        # Find the end of the sentence
-                        end_pos = text.find('.', match_obj.end())
-                        if end_pos == -1:
-                            end_pos = min(len(text), match_obj.end() + 200)
-                        
-                        # Extract the context
-                        context = text[start_pos:end_pos].strip()
-                        
-                        found_clauses.append({
-                            "type": clause_type,
-                            "description": clause_info["description"],
-                            "risk_level": clause_info["risk_level"],
-                            "context": context
-                        })
-                        
-                        # Only use the first match per pattern to avoid redundancy
-                        break
+        for index in range(len(clause_info["patterns"])):
+            # Only use the first match per pattern to avoid redundancy
+            span = hits.get(f"{clause_type}:{index}")
+            if span is None:
+                continue
+            
+            # Extract the sentence containing the match
+            context = sentences.sentence_context(*span)
+            
+            found_clauses.append({
+                "type": clause_type,
+                "description": clause_info["description"],
+                "risk_level": clause_info["risk_level"],
+                "context": context
+            })
     
     # Remove duplicates while preserving order
     unique_clauses = []
@@ -168,13 +354,14 @@ def detect_suspicious_clauses(text):
     
     return unique_clauses
 
-def check_for_scam_templates(text):
+def check_for_scam_templates(text, hits=None):
     """Check if the document resembles known scam templates"""
+    if hits is None:
+        hits = SCAM_RULES.first_hits(text)
     alerts = []
     
     # Check for concentration of scam keywords
-    text_lower = text.lower()
-    keyword_count = sum(1 for keyword in KNOWN_SCAM_KEYWORDS if keyword in text_lower)
+    keyword_count = len(SCAM_KEYWORD_MATCHER.distinct_terms(text))
     
     if keyword_count >= 3:
         alerts.append({
@@ -185,19 +372,8 @@ def check_for_scam_templates(text):
         })
     
     # Check for common scam structures
-    scam_structures = [
-        (r"\b(?:dear|attention|greetings)(?:\s+to)?\s+(?:sir|madam|friend|beneficiary)", "Starts with generic greeting common in scam communications"),
-        (r"\bI\s+(?:am|represent)\s+(?:a|the)\s+(?:bank|attorney|solicitor|barrister)", "Claims to be a financial or legal representative, common in scams"),
-        (r"\b(?:million|billion)\s+(?:dollars|USD|euros|pounds)", "References unusually large sums of money"),
-        (r"\b(?:confidential|private|sensitive)\s+(?:business|transaction|matter|proposal)", "Emphasizes secrecy for a business proposal"),
-        (r"\b(?:next\s+of\s+kin|beneficiary|heir)\s+to\s+(?:the|a)\s+(?:late|deceased)", "Inheritance scam pattern"),
-        (r"\bcontact\s+(?:me|us)\s+(?:(?:as\s+)?soon\s+as\s+possible|immediately|urgently)", "Urges immediate contact"),
-        (r"\b(?:percentage|share|commission)\s+of\s+(?:the|this)\s+(?:fund|money|amount)", "Offers a percentage of funds"),
-        (r"\b(?:God|Allah|heaven)\s+bless\s+(?:you|your|family)", "Religious blessing, common in certain scams")
-    ]
-    
-    for pattern, description in scam_structures:
-        if re.search(pattern, text, re.IGNORECASE):
+    for index, (_, description) in enumerate(SCAM_STRUCTURES):
+        if f"scam_structure:{index}" in hits:
             alerts.append({
                 "type": "scam_structure",
                 "description": f"Document contains language pattern common in scams: {description}",
@@ -207,39 +383,18 @@ def check_for_scam_templates(text):
     
     return alerts
 
-def check_for_unusual_requests(text):
+def check_for_unusual_requests(text, hits=None):
     """Check for unusual requests that might indicate fraud"""
+    if hits is None:
+        hits = SCAM_RULES.first_hits(text)
     alerts = []
     
-    unusual_requests = [
-        (r"\b(?:transfer|send|wire|deposit)\s+(?:money|funds|payment|fee)\s+(?:to|into)\s+(?:my|our|the)\s+(?:account|bank)", 
-         "Requests money transfer to an account"),
-        
-        (r"\b(?:prepay|advance|upfront)\s+(?:fee|payment|deposit|money)\s+(?:of|for|to)\s+", 
-         "Requests advance payment or fee"),
-        
-        (r"\b(?:gift\s+cards?|itunes|amazon|google\s+play|steam)\s+(?:cards?|codes?|vouchers?)", 
-         "Requests payment in gift cards, a common scam tactic"),
-        
-        (r"\bcryptocurrency\s+(?:payment|transfer|wallet|address|bitcoin|ethereum|crypto)", 
-         "Requests cryptocurrency payment, often used in scams due to irreversibility"),
-        
-        (r"\b(?:sensitive|confidential|personal)\s+(?:information|details|data)\s+(?:such\s+as|including|like)\s+(?:passport|driver's\s+license|id|birth\s+certificate)", 
-         "Requests excessive personal identification documents"),
-        
-        (r"\bverification\s+(?:code|number|pin)\s+(?:sent|received|texted|messaged)\s+to\s+(?:your|the)\s+(?:phone|mobile|cell)", 
-         "Requests verification codes sent to your phone, common in identity theft"),
-        
-        (r"\bdo\s+not\s+(?:tell|inform|share|discuss)\s+(?:with|this|anyone|anybody|lawyers|attorneys|accountants)", 
-         "Requests secrecy or non-disclosure to professional advisors")
-    ]
-    
-    for pattern, description in unusual_requests:
-        match = re.search(pattern, text, re.IGNORECASE)
-        if match:
+    for index, (_, description) in enumerate(UNUSUAL_REQUESTS):
+        span = hits.get(f"unusual_request:{index}")
+        if span:
             # Get the context around the match
-            start_pos = max(0, match.start() - 100)
-            end_pos = min(len(text), match.end() + 100)
+            start_pos = max(0, span[0] - 100)
+            end_pos = min(len(text), span[1] + 100)
             context = text[start_pos:end_pos].strip()
             
             alerts.append({
@@ -251,27 +406,15 @@ def check_for_unusual_requests(text):
     
     return alerts
 
-def check_for_inconsistencies(text):
+def check_for_inconsistencies(text, hits=None):
     """Check for internal inconsistencies that might indicate fraud"""
+    if hits is None:
+        hits = SCAM_RULES.first_hits(text)
     alerts = []
     
     # Check for conflicting statements or terms
-    conflicting_terms = [
-        (r"\bno\s+(?:fee|cost|charge)\b", r"\b(?:pay|payment|fee|cost|charge)\s+of\s+[\$\€\£]?\s*\d+", 
-         "Document claims no fees but then mentions payments/charges"),
-        
-        (r"\bfree\b", r"\bcosts?\s+[\$\€\£]?\s*\d+", 
-         "Document claims to be free but then mentions costs"),
-        
-        (r"\bno\s+obligation\b", r"\bmust\s+(?:pay|provide|submit|agree)", 
-         "Document claims no obligation but then imposes requirements"),
-        
-        (r"\bguaranteed\b", r"\bno\s+(?:guarantee|warranty|assurance)", 
-         "Document provides conflicting statements about guarantees")
-    ]
-    
-    for pattern1, pattern2, description in conflicting_terms:
-        if re.search(pattern1, text, re.IGNORECASE) and re.search(pattern2, text, re.IGNORECASE):
+    for index, (_, _, description) in enumerate(CONFLICTING_TERMS):
+        if f"inconsistency:{index}:first" in hits and f"inconsistency:{index}:second" in hits:
             alerts.append({
                 "type": "inconsistency",
                 "description": description,
@@ -280,7 +423,7 @@ def check_for_inconsistencies(text):
             })
     
     # Check for inconsistent company or entity names
-    company_names = re.findall(r'\b(?:[A-Z][a-z]*\s+)+(?:LLC|Inc|Ltd|Corporation|Corp|Company|Co|GmbH|SA|NV|PLC)\b', text)
+    company_names = COMPANY_NAME_PATTERN.findall(text)
     if len(company_names) >= 2:
         # Count occurrences of each name
         name_counter = Counter(company_names)
@@ -301,20 +444,25 @@ def detect_scams(text):
     """Main function to detect scams in document text"""
     all_alerts = []
     
+    # Match every regex rule against the text in one pass
+    with stage_timer('scam_rules'):
+        hits = SCAM_RULES.first_hits(text)
+    sentences = SentenceIndex(text)
+    
     # Detect suspicious clauses
-    suspicious_clauses = detect_suspicious_clauses(text)
+    suspicious_clauses = detect_suspicious_clauses(text, hits, sentences)
     all_alerts.extend(suspicious_clauses)
     
     # Check for known scam templates
-    scam_template_alerts = check_for_scam_templates(text)
+    scam_template_alerts = check_for_scam_templates(text, hits)
     all_alerts.extend(scam_template_alerts)
     
     # Check for unusual requests
-    unusual_request_alerts = check_for_unusual_requests(text)
+    unusual_request_alerts = check_for_unusual_requests(text, hits)
     all_alerts.extend(unusual_request_alerts)
     
     # Check for inconsistencies
-    inconsistency_alerts = check_for_inconsistencies(text)
+    inconsistency_alerts = check_for_inconsistencies(text, hits)
     all_alerts.extend(inconsistency_alerts)
     
     # Calculate risk score
@@ -325,6 +473,7 @@ def detect_scams(text):
     
     return {
         "alerts": formatted_alerts,
+        "details": all_alerts,
         "risk_score": risk_score
     }
 
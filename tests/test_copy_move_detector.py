@@ -0,0 +1,52 @@
+import cv2
+import numpy as np
+
+from copy_move_detector import find_copy_move_regions
+from forgery_detector import detect_image_manipulation
+
+def _page_with_text(lines):
+    """A blank 200 DPI letter page with numbered body text"""
+    page = np.full((2200, 1700), 255, np.uint8)
+    for i in range(lines):
+        cv2.putText(page, f"The parties agree to the terms set out in section {i} above.", (120, 150 + i * 45),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.9, 0, 2, cv2.LINE_AA)
+    return page
+
+def signature_block_page():
+    """Two-party signature block: the same labels and rules side by side"""
+    page = _page_with_text(25)
+    for x, party in ((150, "PARTY A"), (950, "PARTY B")):
+        cv2.putText(page, party, (x, 1400), cv2.FONT_HERSHEY_SIMPLEX, 1.0, 0, 2, cv2.LINE_AA)
+        for row, label in enumerate(("By:", "Name:", "Title:", "Date:")):
+            y = 1500 + row * 110
+            cv2.putText(page, label, (x, y), cv2.FONT_HERSHEY_SIMPLEX, 1.0, 0, 2, cv2.LINE_AA)
+            cv2.line(page, (x + 120, y + 5), (x + 600, y + 5), 0, 2)
+    return page
+
+def initials_page():
+    """Form page repeating the same initials line three times"""
+    page = _page_with_text(30)
+    for row in range(3):
+        cv2.putText(page, "Initials: ________   Date: ________", (200, 1600 + row * 150),
+                    cv2.FONT_HERSHEY_SIMPLEX, 1.1, 0, 2, cv2.LINE_AA)
+    return page
+
+def test_signature_block_is_not_copy_move():
+    assert find_copy_move_regions(signature_block_page()) == []
+
+def test_repeated_initials_lines_are_not_copy_move():
+    assert find_copy_move_regions(initials_page()) == []
+
+def test_form_pages_raise_no_manipulation_alert():
+    for page in (signature_block_page(), initials_page()):
+        assert detect_image_manipulation(cv2.cvtColor(page, cv2.COLOR_GRAY2BGR), 200) == []
+
+def test_pasted_scan_is_still_detected():
+    page = signature_block_page()
+    scan = cv2.GaussianBlur((np.random.RandomState(3).rand(180, 300) * 255).astype(np.uint8), (3, 3), 0)
+    page[200:380, 1200:1500] = scan
+    page[900:1080, 1250:1550] = scan
+
+    regions = find_copy_move_regions(page)
+    assert len(regions) == 1
+    assert regions[0]["offset"] == (50, 700)
@@ -0,0 +1,53 @@
+import random
+
+import pytest
+import spacy
+
+import document_analyzer
+from document_analyzer import process_texts, split_into_chunks
+
+ENTITIES = [
+    ("ORG", "Acme Corporation"), ("ORG", "Globex Inc"), ("PERSON", "John Smith"), ("PERSON", "Jane Roe"),
+    ("DATE", "January 5, 2024"), ("DATE", "March 1"), ("GPE", "New York"), ("MONEY", "$5,000"),
+]
+FILLER = "the parties agree that payment is due and this agreement may be terminated with notice".split()
+
+@pytest.fixture
+def ruler_nlp(monkeypatch):
+    """A deterministic pipeline, so chunked and whole-text entities can be compared exactly"""
+    nlp = spacy.blank("en")
+    ruler = nlp.add_pipe("entity_ruler")
+    ruler.add_patterns([{"label": label, "pattern": text} for label, text in ENTITIES])
+    monkeypatch.setattr(document_analyzer, "get_nlp", lambda: nlp)
+    return nlp
+
+def random_text(rng, words):
+    """Sentences of filler words with entities sprinkled in"""
+    parts = []
+    for _ in range(words):
+        parts.append(rng.choice(ENTITIES)[1] if rng.random() < 0.15 else rng.choice(FILLER))
+        if rng.random() < 0.08:
+            parts[-1] += "."
+    return " ".join(parts)
+
+def entity_tuples(ents):
+    return [(ent.text, ent.label_, ent.start_char, ent.end_char) for ent in ents]
+
+def test_chunked_entities_match_a_whole_text_pass(ruler_nlp, monkeypatch):
+    monkeypatch.setattr(document_analyzer, "split_into_chunks",
+                        lambda text: split_into_chunks(text, chunk_size=300, overlap=60))
+    rng = random.Random(5)
+    texts = [random_text(rng, rng.randint(20, 800)) for _ in range(60)]
+
+    for text, doc in zip(texts, process_texts(texts)):
+        assert entity_tuples(doc.ents) == entity_tuples(ruler_nlp(text).ents)
+
+def test_chunks_cover_the_text_and_overlap():
+    rng = random.Random(9)
+    text = random_text(rng, 2000)
+    chunks = split_into_chunks(text, chunk_size=300, overlap=60)
+
+    assert chunks[0][0] == 0 and chunks[-1][1] == len(text)
+    for (start, end), (next_start, next_end) in zip(chunks, chunks[1:]):
+        assert end - start <= 300
+        assert next_start < end < next_end
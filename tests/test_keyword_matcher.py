@@ -0,0 +1,49 @@
+import random
+import re
+
+from keyword_matcher import KeywordAutomaton
+from scam_detector import KNOWN_SCAM_KEYWORDS, SCAM_KEYWORD_MATCHER
+
+FILLER = "the payment agreement party shall send funds via account please urgent card gift wire".split()
+ENDINGS = ["", "", "s", "es", "ed", "back", "ing"]
+
+def random_texts(count, seed=7):
+    """Texts mixing scam keywords (with assorted endings and casing) into filler words"""
+    rng = random.Random(seed)
+    for _ in range(count):
+        words = []
+        for _ in range(rng.randint(5, 60)):
+            if rng.random() < 0.2:
+                word = rng.choice(KNOWN_SCAM_KEYWORDS) + rng.choice(ENDINGS)
+                words.append(word.upper() if rng.random() < 0.1 else word)
+            else:
+                words.append(rng.choice(FILLER))
+        yield " ".join(words) + rng.choice(["", ".", "!", ","])
+
+def reference_terms(text, suffixes):
+    """What the automaton replaces: one case-insensitive whole-word regex search per term"""
+    endings = "|".join(re.escape(suffix) for suffix in suffixes)
+    return {term for term in KNOWN_SCAM_KEYWORDS
+            if re.search(rf"\b{re.escape(term)}(?:{endings})?\b", text, re.IGNORECASE)}
+
+def test_scam_keywords_match_regex_reference():
+    for text in random_texts(3000):
+        assert SCAM_KEYWORD_MATCHER.distinct_terms(text) == reference_terms(text, ("s", "es")), text
+
+def test_plain_automaton_matches_regex_reference():
+    matcher = KeywordAutomaton(KNOWN_SCAM_KEYWORDS)
+    for text in random_texts(1000, seed=11):
+        assert matcher.distinct_terms(text) == reference_terms(text, ()), text
+
+def test_plurals_count_as_the_keyword():
+    assert SCAM_KEYWORD_MATCHER.distinct_terms("pay in bitcoin or gift cards") == {"bitcoin", "gift card"}
+    assert SCAM_KEYWORD_MATCHER.distinct_terms("two wire transfers, in bitcoins") == {"wire transfer", "bitcoin"}
+    assert SCAM_KEYWORD_MATCHER.distinct_terms("a gift card and two gift cards") == {"gift card"}
+
+def test_keywords_inside_longer_words_do_not_match():
+    assert SCAM_KEYWORD_MATCHER.distinct_terms("thanks for the advance feedback") == set()
+
+def test_hit_offsets_cover_the_matched_text():
+    text = "Send Gift Cards today"
+    assert SCAM_KEYWORD_MATCHER.find_all(text) == [("gift card", 5, 15)]
+    assert text[5:15] == "Gift Cards"
@@ -0,0 +1,74 @@
+import random
+import re
+
+from scam_detector import RuleMatcher, SCAM_RULES, _build_scam_rules
+
+# Phrases that match (or nearly match) the rule tables, mixed with filler text
+FRAGMENTS = [
+    "The Company may terminate this agreement at any time without notice",
+    "at its sole discretion to terminate", "the right to cancel immediately",
+    "Additional fees may apply", "reserves the right to charge additional fees",
+    "fees subject to change without prior notice", "pricing may be modified at any time",
+    "shall not be liable for any reason", "The Client waives all claims", "holds harmless from all",
+    "indemnify and defend against all", "shall automatically renew for successive terms",
+    "renewal will continue until cancelled", "unless written notice is given at least 30 days",
+    "assigns all rights", "copyright shall vest exclusively", "waives all moral rights",
+    "non-disclosure shall remain in effect indefinitely",
+    "confidentiality obligations shall survive termination for a period of 10 years",
+    "all information shared shall be considered confidential",
+    "disputes shall be resolved exclusively by binding arbitration",
+    "waives any rights to participate in a class action", "arbitration shall take place in Lagos",
+    "may modify the terms at any time", "changes will be effective upon posting",
+    "continued use constitutes acceptance", "penalty of $500", "fee of 15 percent",
+    "liquidated damages in the amount of $1,000", "failure to comply will result in a penalty",
+    "personally guarantees", "individual signing shall be personally liable", "jointly and severally liable",
+    "must sign immediately", "time is of the essence", "limited-time offer", "expires within 48 hours",
+    "Dear Sir", "Greetings to beneficiary", "I represent the bank", "ten million dollars",
+    "confidential transaction", "next of kin to the late", "contact me as soon as possible",
+    "share of the fund", "God bless you", "transfer money to my account", "advance fee of",
+    "gift card codes", "itunes vouchers", "cryptocurrency wallet",
+    "confidential details such as passport", "verification code sent to your phone",
+    "do not tell anyone", "no fee", "payment of $50", "free", "costs 10", "no obligation",
+    "must pay", "guaranteed", "no warranty",
+    # Near misses, case-folding characters and separators
+    "terminated", "freedom", "feedback", "mustard", "no-fee", "Kelvin", "ſole discretion",
+    "Ünïcode ß", "İstanbul", "the parties agree", "payment is due", "\n", ". ", "  ",
+]
+
+def random_texts(count, seed=0):
+    """Documents stitched together from fragments, sometimes upper-cased"""
+    rng = random.Random(seed)
+    for _ in range(count):
+        parts = [rng.choice(FRAGMENTS) for _ in range(rng.randint(1, 40))]
+        text = rng.choice([" ", ". ", "\n", ", "]).join(parts)
+        yield text.upper() if rng.random() < 0.3 else text
+
+def reference_hits(rules, text):
+    """What RuleMatcher replaces: a separate re.search() for every rule"""
+    hits = {}
+    for rule_id, pattern in rules:
+        match_obj = re.search(pattern, text, re.IGNORECASE)
+        if match_obj:
+            hits[rule_id] = match_obj.span()
+    return hits
+
+def test_first_hits_match_a_search_per_rule():
+    rules = _build_scam_rules()
+    matched_rules = set()
+    for text in random_texts(3000):
+        hits = SCAM_RULES.first_hits(text)
+        assert hits == reference_hits(rules, text), text
+        matched_rules.update(hits)
+    # The texts must exercise most rules for the comparison to mean anything
+    assert len(matched_rules) >= 0.9 * len(rules)
+
+def test_every_scam_rule_gets_a_trigger():
+    # A rule without literal prefixes is searched separately: still correct, but slow
+    assert SCAM_RULES.untriggered == []
+
+def test_rules_without_literal_prefix_are_searched_directly():
+    rules = [("digits", r"\d+\s+days"), ("word", r"\bnotice\b")]
+    matcher = RuleMatcher(rules)
+    assert matcher.untriggered == [0]
+    for text in ["notice within 30 days", "30 DAYS NOTICE", "no match here"]:
+        assert matcher.first_hits(text) == reference_hits(rules, text)
@@ -1,86 +1,239 @@
 import os
 import logging
-import pytesseract
 from PIL import Image
 import docx
-import PyPDF2
-import pdf2image
-import tempfile
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from page_images import PageImageProvider
+from document import as_document
+from metrics import stage_timer
+from deadline import AnalysisDeadlineExceeded, check_deadline, time_left
+from ocr_engine import ocr_engine, OCR_BATCH_SIZE
+from ocr_cache import ocr_cache, ocr_image, ocr_images, image_key
 
 logger = logging.getLogger(__name__)
 
-def extract_text_from_pdf(pdf_path):
+# Process pool used to OCR scanned PDF pages in parallel
+OCR_WORKERS = int(os.environ.get('OCR_WORKERS', os.cpu_count() or 1))
+OCR_MAX_PAGES_IN_FLIGHT = int(os.environ.get('OCR_MAX_PAGES_IN_FLIGHT', OCR_WORKERS * OCR_BATCH_SIZE))
+
+_ocr_executor = None
+_ocr_executor_lock = threading.Lock()
+
+def _ocr_images(images, deadline=None):
+    """
+    OCR a batch of uncached page images with one tesseract run (runs inside the OCR process pool)
+    The deadline is a time.monotonic() value, which is system-wide, so it holds in the worker too
+    """
+    return ocr_engine.images_to_strings(images, deadline)
+
+def _ocr_batch_size(page_count):
+    """Pages per tesseract run: enough to share start-up costs, few enough to keep every worker busy"""
+    return max(1, min(OCR_BATCH_SIZE, -(-page_count // OCR_WORKERS)))
+
+def _get_ocr_executor():
+    """Lazily create the process pool shared by all OCR requests in this process"""
+    global _ocr_executor
+    with _ocr_executor_lock:
+        if _ocr_executor is None:
+            # forkserver avoids forking the (multi-threaded) web process itself
+            _ocr_executor = ProcessPoolExecutor(
+                max_workers=OCR_WORKERS,
+                mp_context=multiprocessing.get_context('forkserver')
+            )
+        return _ocr_executor
+
+def ocr_pdf_pages(page_images, page_numbers, deadline=None):
+    """
+    OCR the given 1-based PDF pages in parallel and return their text in page order
+
+    Each page image is released with its text as soon as that is known, which
+    lets the page's forgery checks take the image over instead of rendering the
+    page again. Raises
+    AnalysisDeadlineExceeded once the deadline (a time.monotonic() value) passes.
+    """
+    page_numbers = list(page_numbers)
+    results = {}
+    if OCR_WORKERS <= 1 or len(page_numbers) <= 1:
+        # Render and OCR a bounded batch at a time, as the pool below does
+        for start in range(0, len(page_numbers), OCR_MAX_PAGES_IN_FLIGHT):
+            check_deadline(deadline, "Analysis deadline passed during OCR")
+            batch = page_numbers[start:start + OCR_MAX_PAGES_IN_FLIGHT]
+            page_images.render(batch)
+            rendered = [(page_number, page_images.get_page(page_number)) for page_number in batch]
+            rendered = [(page_number, image) for page_number, image in rendered if image is not None]
+            results.update(zip([page_number for page_number, _ in rendered],
+                               ocr_images([image for _, image in rendered], deadline=deadline)))
+            page_images.release(batch, [results.get(page_number) for page_number in batch])
+        return [results.get(page_number, "") for page_number in page_numbers]
+    
+    executor = _get_ocr_executor()
+    batch_size = _ocr_batch_size(len(page_numbers))
+    pending = {}  # future -> image keys in its batch
+    waiting = {}  # image key -> page numbers showing that image
+    pages_in_flight = 0
+    remaining = deque(page_numbers)
+    
+    # Keep at most OCR_MAX_PAGES_IN_FLIGHT pages rasterized/OCR'd at once to bound memory
+    while remaining or pending:
+        try:
+            check_deadline(deadline, "Analysis deadline passed during OCR")
+        except AnalysisDeadlineExceeded:
+            # Batches already running finish on their own; queued ones never start
+            for future in pending:
+                future.cancel()
+            raise
+        
+        free_slots = OCR_MAX_PAGES_IN_FLIGHT - pages_in_flight
+        if remaining and free_slots > 0:
+            batch = [remaining.popleft() for _ in range(min(free_slots, len(remaining)))]
+            page_images.render(batch)
+            # The cache is checked here, in this process, so pages OCR'd before
+            # (or repeated within this document) are not sent to the pool
+            uncached = []
+            for page_number in batch:
+                image = page_images.get_page(page_number)
+                if image is None:
+                    results[page_number] = ""
+                    continue
+                key = image_key(image)
+                if key in waiting:
+                    # Same image as a page already sent; it gets that page's text
+                    waiting[key].append(page_number)
+                    pages_in_flight += 1
+                    continue
+                text = ocr_cache.get(key)
+                if text is not None:
+                    results[page_number] = text
+                    page_images.release([page_number], [text])
+                else:
+                    waiting[key] = [page_number]
+                    uncached.append((key, image))
+            
+            # Hand each worker several pages per tesseract run
+            for start in range(0, len(uncached), batch_size):
+                chunk = uncached[start:start + batch_size]
+                future = executor.submit(_ocr_images, [image for _, image in chunk], deadline)
+                pending[future] = [key for key, _ in chunk]
+                pages_in_flight += len(chunk)
+        
+        if not pending:
+            continue
+        
+        done, _ = wait(pending, timeout=time_left(deadline), return_when=FIRST_COMPLETED)
+        for future in done:
+            chunk_keys = pending.pop(future)
+            for key, text in zip(chunk_keys, future.result()):
+                ocr_cache.put(key, text)
+                chunk_pages = waiting.pop(key)
+                pages_in_flight -= len(chunk_pages)
+                for page_number in chunk_pages:
+                    results[page_number] = text
+                # Only released now: the pool pickles images after submit() returns
+                page_images.release(chunk_pages, [text] * len(chunk_pages))
+    
+    return [results[page_number] for page_number in page_numbers]
+
+def extract_text_from_pdf(document, page_images=None, deadline=None):
     """Extract text from PDF files"""
     text = ""
+    document = as_document(document)
+    owns_page_images = page_images is None
+    if owns_page_images:
+        page_images = PageImageProvider(document)
+    
     try:
-        # Try to extract text directly from PDF
-        with open(pdf_path, 'rb') as file:
-            pdf_reader = PyPDF2.PdfReader(file)
+        # Try to extract text directly from the already parsed PDF
+        pdf_reader = document.pdf_reader
+        
+        page_texts = []
+        scanned_pages = []
+        for page_num in range(len(pdf_reader.pages)):
+            page = pdf_reader.pages[page_num]
+            page_text = page.extract_text()
             
-            for page_num in range(len(pdf_reader.pages)):
-                page = pdf_reader.pages[page_num]
-                page_text = page.extract_text()
-                
-                # If page has no text, it might be scanned - use OCR
-                if not page_text or page_text.isspace():
-                    logger.info(f"Page {page_num+1} appears to be scanned, using OCR")
-                    # Convert PDF page to image
-                    images = pdf2image.convert_from_path(
-                        pdf_path, 
-                        first_page=page_num+1, 
-                        last_page=page_num+1
-                    )
-                    
-                    if images:
-                        # Apply OCR to the image
-                        page_text = pytesseract.image_to_string(images[0])
-                
-                text += page_text + "\n"
+            # If page has no text, it might be scanned - use OCR
+            if not page_text or page_text.isspace():
+                logger.info(f"Page {page_num+1} appears to be scanned, using OCR")
+                scanned_pages.append(page_num)
+            
+            page_texts.append(page_text or "")
+        
+        # OCR the scanned pages in parallel, keeping page order in the output
+        if scanned_pages:
+            with stage_timer('ocr'):
+                ocr_texts = ocr_pdf_pages(page_images, [page_num + 1 for page_num in scanned_pages], deadline)
+            for page_num, page_text in zip(scanned_pages, ocr_texts):
+                page_texts[page_num] = page_text
+        document.page_texts = page_texts
+        
+        for page_text in page_texts:
+            text += page_text + "\n"
                 
         if not text or text.isspace():
             logger.info("No text extracted from PDF, attempting full OCR")
-            # If no text was extracted, convert the entire PDF to images and OCR them
-            images = pdf2image.convert_from_path(pdf_path)
-            for image in images:
-                text += pytesseract.image_to_string(image) + "\n"
+            # If no text was extracted, OCR the pages poppler sees that were not OCR'd above
+            ocr_done = {page_num + 1 for page_num in scanned_pages}
+            remaining_pages = [page_number for page_number in range(1, page_images.page_count + 1)
+                               if page_number not in ocr_done]
+            with stage_timer('ocr'):
+                ocr_texts = ocr_pdf_pages(page_images, remaining_pages, deadline)
+            for page_text in ocr_texts:
+                text += page_text + "\n"
+            # Every parsed page was already OCR'd, so these are pages only poppler sees
+            page_texts.extend(ocr_texts)
                 
     except Exception as e:
         logger.error(f"Error extracting text from PDF: {str(e)}", exc_info=True)
         raise
+    finally:
+        if owns_page_images:
+            page_images.close()
         
     return text
 
-def extract_text_from_docx(docx_path):
+def extract_text_from_docx(document):
     """Extract text from DOCX files"""
     try:
-        doc = docx.Document(docx_path)
+        doc = docx.Document(as_document(document).stream())
         text = '\n'.join([paragraph.text for paragraph in doc.paragraphs])
         return text
     except Exception as e:
         logger.error(f"Error extracting text from DOCX: {str(e)}", exc_info=True)
         raise
 
-def extract_text_from_image(image_path):
+def extract_text_from_image(document, deadline=None):
     """Extract text from image files using OCR"""
     try:
-        image = Image.open(image_path)
-        text = pytesseract.image_to_string(image)
+        document = as_document(document)
+        image = Image.open(document.stream())
+        with stage_timer('ocr'):
+            text = ocr_image(image, deadline=deadline)
+        # Kept for the signature check, which would otherwise OCR the image again
+        document.page_texts = [text]
         return text
     except Exception as e:
         logger.error(f"Error extracting text from image: {str(e)}", exc_info=True)
         raise
 
-def extract_text_from_document(file_path):
-    """Extract text from various document formats"""
+def extract_text_from_document(document, page_images=None, deadline=None):
+    """
+    Extract text from various document formats (a Document or a file path)
+    OCR stops with AnalysisDeadlineExceeded if it runs past deadline
+    """
     try:
-        file_extension = os.path.splitext(file_path)[1].lower()
+        document = as_document(document)
+        file_extension = document.extension
         
         if file_extension == '.pdf':
-            return extract_text_from_pdf(file_path)
+            return extract_text_from_pdf(document, page_images, deadline)
         elif file_extension == '.docx':
-            return extract_text_from_docx(file_path)
+            return extract_text_from_docx(document)
         elif file_extension in ['.jpg', '.jpeg', '.png']:
-            return extract_text_from_image(file_path)
+            return extract_text_from_image(document, deadline)
         else:
             logger.error(f"Unsupported file type: {file_extension}")
             raise ValueError(f"Unsupported file type: {file_extension}")
@@ -0,0 +1,67 @@
+import bisect
+from itertools import accumulate
+
+def _char_offsets(text, char):
+    """Offsets of every occurrence of a single character, in ascending order"""
+    parts = text.split(char)
+    # Each occurrence sits right after the part before it
+    return [offset - 1 for offset in accumulate(len(part) + 1 for part in parts[:-1])]
+
+class SentenceIndex:
+    """
+    Sentence and line boundary offsets of a document, computed once so the
+    sentence around any match can be found with a binary search instead of
+    rescanning the text before it
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self._periods = None
+        self._newlines = None
+
+    @property
+    def periods(self):
+        """Offsets of every period, built on first use"""
+        if self._periods is None:
+            self._periods = _char_offsets(self.text, '.')
+        return self._periods
+
+    @property
+    def newlines(self):
+        """Offsets of every line break, built on first use"""
+        if self._newlines is None:
+            self._newlines = _char_offsets(self.text, '\n')
+        return self._newlines
+
+    def last_before(self, offsets, position):
+        """Largest offset strictly before position, or -1"""
+        index = bisect.bisect_left(offsets, position)
+        return offsets[index - 1] if index > 0 else -1
+
+    def first_at_or_after(self, offsets, position):
+        """Smallest offset at or after position, or -1"""
+        index = bisect.bisect_left(offsets, position)
+        return offsets[index] if index < len(offsets) else -1
+
+    def sentence_bounds(self, start, end, fallback_length=200):
+        """
+        Return the (start, end) offsets of the sentence around a match
+
+        The sentence starts after the last period before the match (or the last
+        line break when there is no earlier period) and ends at the next period,
+        or fallback_length characters after the match if none follows.
+        """
+        start_pos = max(0, self.last_before(self.periods, start) + 1)
+        if start_pos == 0:
+            start_pos = max(0, self.last_before(self.newlines, start) + 1)
+
+        end_pos = self.first_at_or_after(self.periods, end)
+        if end_pos == -1:
+            end_pos = min(len(self.text), end + fallback_length)
+
+        return start_pos, end_pos
+
+    def sentence_context(self, start, end, fallback_length=200):
+        """Return the stripped text of the sentence around a match"""
+        start_pos, end_pos = self.sentence_bounds(start, end, fallback_length)
+        return self.text[start_pos:end_pos].strip()